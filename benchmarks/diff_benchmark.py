@@ -0,0 +1,26 @@
+# compare the old list based episode diff with scraper.diff
+# usage: python -m benchmarks.diff_benchmark [episodes]
+import sys
+import timeit
+from scraper.diff import diff_show_lists
+
+
+def list_diff(current_show_list, old_show_list):
+    return list(filter(lambda x: x not in old_show_list, current_show_list))
+
+
+def make_show_list(episodes):
+    return [('play{}'.format(i), 'Episode {}'.format(i)) for i in range(episodes)]
+
+
+def main():
+    episodes = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    old_show_list = make_show_list(episodes)
+    current_show_list = make_show_list(episodes + 10)
+    for name, diff in [('list', list_diff), ('set', diff_show_lists)]:
+        seconds = min(timeit.repeat(lambda: diff(current_show_list, old_show_list), number=1, repeat=3))
+        print('{:<5} {} episodes: {:.4f}s'.format(name, episodes, seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+# check that the web app starts without the scraping engine and within an import time budget
+# usage: python -m benchmarks.import_budget [--budget-ms 1500] [--repeat 3]
+# exits with 1 if a scraping module is imported or the fastest start exceeds the budget
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# what the web tier must not import at startup, the scraping engine is only
+# loaded by the cron job and the CLI
+FORBIDDEN_MODULES = (
+    'chaser', 'core.outbox', 'scraper.browser', 'scraper.diff', 'scraper.fetch', 'scraper.lease', 'scraper.throttle',
+    'requests', 'selenium')
+
+# what a web worker runs before serving its first request
+STARTUP = 'import json, sys; import core; print(json.dumps(sorted(sys.modules)))'
+
+
+# returns (seconds spent importing, {top level module: seconds}, loaded module names)
+# tests/test_import_budget.py runs it too
+def measure():
+    env = dict(os.environ, FLASK_DEBUG='1', PYTHONPATH=ROOT)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', STARTUP],
+        cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    top_level = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # nested imports are indented below the module importing them
+        if not name.startswith('  '):
+            top_level[name.strip()] = int(cumulative) / 1000000.0
+    return sum(top_level.values()), top_level, json.loads(result.stdout.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import time budget of the web app')
+    parser.add_argument('--budget-ms', type=float, default=1500)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    runs = [measure() for _ in range(args.repeat)]
+    seconds, top_level, modules = min(runs, key=lambda run: run[0])
+    for name, module_seconds in sorted(top_level.items(), key=lambda item: -item[1])[:10]:
+        print('{:<30} {:8.1f}ms'.format(name, module_seconds * 1000))
+    print('{:<30} {:8.1f}ms (budget {:.0f}ms)'.format('total', seconds * 1000, args.budget_ms))
+    failed = False
+    for forbidden in FORBIDDEN_MODULES:
+        if forbidden in modules:
+            print('{} is imported by the web app'.format(forbidden))
+            failed = True
+    if seconds * 1000 > args.budget_ms:
+        print('Import time exceeds the budget')
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+# two cron workers sharing runs through scraper.lease against a throwaway
+# redis-server and the fake ifvod server of the load test
+# usage: python -m benchmarks.lease_test [--dramas 200] [--batch-size 10]
+# exits with 1 if a drama is scraped twice in a run, missed, or its expired lease is not taken over
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+from threading import Thread
+import time
+from urllib.parse import urlparse
+from benchmarks.load_test import FakeIFVODServer, ROOT, start_redis, start_server
+
+# sync and async workers in every combination
+MODES = (('sync', 'sync'), ('async', 'async'), ('sync', 'async'))
+
+
+# counts detail page requests per drama
+class CountingIFVODServer(FakeIFVODServer):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.fetches = {}
+
+    def get_page(self, site_id, render):
+        with self.lock:
+            self.fetches[site_id] = self.fetches.get(site_id, 0) + 1
+        return super().get_page(site_id, render)
+
+
+def run_worker(chaser, mode, errors):
+    try:
+        if mode == 'async':
+            asyncio.run(chaser.async_scheduled_chase())
+        else:
+            chaser.scheduled_chase()
+    except Exception as ex:
+        errors.append(ex)
+
+
+# returns list of failures
+def check_shared_run(modes, drama_ids, ifvod, redis_client):
+    import chaser
+    from core.dramas import DramaLibrary
+    failures = []
+    redis_client.flushdb()
+    for i, drama_id in enumerate(drama_ids):
+        DramaLibrary().chase('user{}@lease.local'.format(i % 10), drama_id, None)
+    ifvod.fetches = {}
+    errors = []
+    threads = [Thread(target=run_worker, args=(chaser.DramaChaser(), mode, errors)) for mode in modes]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    failures += ['worker failed: {}'.format(ex) for ex in errors]
+    twice = sorted(site_id for site_id, count in ifvod.fetches.items() if count > 1)
+    missed = sorted(set(drama_ids) - set(ifvod.fetches))
+    if len(twice) != 0:
+        failures.append('{} dramas scraped more than once: {}'.format(len(twice), ', '.join(twice[:10])))
+    if len(missed) != 0:
+        failures.append('{} dramas not scraped: {}'.format(len(missed), ', '.join(missed[:10])))
+    print('{:<12} {} dramas, {} requests, {} scraped twice, {} missed'.format(
+        '+'.join(modes), len(drama_ids), sum(ifvod.fetches.values()), len(twice), len(missed)))
+    return failures
+
+
+# a drama leased by a worker which died is scraped once its lease expires
+def check_expired_lease(modes, ttl, ifvod, redis_client):
+    import chaser
+    from core.dramas import DramaLibrary
+    from scraper.lease import LeaseManager
+    failures = []
+    redis_client.flushdb()
+    DramaLibrary().chase('user@lease.local', 'orphan', None)
+    # never entered, so no heartbeat renews the lease
+    dead_worker = LeaseManager(redis_client, ttl=ttl)
+    if dead_worker.acquire_all(['orphan']) != ['orphan']:
+        failures.append('dead worker could not lease the drama')
+    ifvod.fetches = {}
+    start = time.time()
+    errors = []
+    threads = [Thread(target=run_worker, args=(chaser.DramaChaser(), mode, errors)) for mode in modes]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.time() - start
+    failures += ['worker failed: {}'.format(ex) for ex in errors]
+    if ifvod.fetches.get('orphan') != 1:
+        failures.append('expired lease scraped {} times'.format(ifvod.fetches.get('orphan', 0)))
+    if seconds < ttl:
+        failures.append('lease taken over after {:.2f}s, before it expired'.format(seconds))
+    # releasing a lease someone else holds must not delete it
+    owner = LeaseManager(redis_client, ttl=ttl)
+    redis_client.delete('lease:orphan')
+    owner.acquire_all(['orphan'])
+    dead_worker.release_all(['orphan'])
+    if not redis_client.exists('lease:orphan'):
+        failures.append('a stale owner released the lease of another worker')
+    print('{:<12} expired lease taken over after {:.2f}s'.format('+'.join(modes), seconds))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Lease sharing between cron workers')
+    parser.add_argument('--dramas', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=10)
+    parser.add_argument('--latency-ms', type=float, default=10, help='fake ifvod response delay')
+    parser.add_argument('--lease-ttl', type=int, default=2)
+    parser.add_argument('--redis-server', default='redis-server')
+    args = parser.parse_args()
+
+    ifvod = start_server(CountingIFVODServer(5, args.latency_ms / 1000.0, 1, set()))
+    redis_process, redis_port = start_redis(args.redis_server)
+    tmpdir = tempfile.mkdtemp(prefix='dramachaser-lease-')
+    # the app writes logs/ to the working directory
+    sys.path.insert(0, ROOT)
+    os.chdir(tmpdir)
+    # config is read when core is imported
+    os.environ.update({
+        'DATABASE_URL': 'sqlite:///' + os.path.join(tmpdir, 'lease.db'),
+        'REDIS_HOST': '127.0.0.1',
+        'REDIS_PORT': str(redis_port),
+        'REDIS_DB': '0',
+        'IFVOD_RATE': '100000',
+        'IFVOD_BURST': '100000',
+        'LEASE_TTL': str(args.lease_ttl),
+        'LEASE_BATCH_SIZE': str(args.batch_size),
+        'LEASE_RETRY_INTERVAL': '0.1',
+        'ACTIVITY_NO_SHUTDOWN_FLUSH': '1'
+    })
+    failures = []
+    try:
+        from core import dramas, redis_client
+        from scraper.providers import IFVODProvider
+        dramas.PROVIDERS[dramas.VOD.IFVOD] = type('LocalIFVODProvider', (IFVODProvider,), {
+            'base_url': ifvod.base_url,
+            'domain': urlparse(ifvod.base_url).netloc
+        })
+        drama_ids = ['d{}'.format(i) for i in range(args.dramas)]
+        for modes in MODES:
+            failures += check_shared_run(modes, drama_ids, ifvod, redis_client)
+            failures += check_expired_lease(modes, args.lease_ttl, ifvod, redis_client)
+    finally:
+        redis_process.terminate()
+        redis_process.wait()
+    for failure in failures:
+        print('FAILED {}'.format(failure))
+    sys.exit(1 if len(failures) != 0 else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,413 @@
+# end to end load test of the cron run, outbox delivery and the index page
+# against local stand-ins: a fake ifvod server, a throwaway redis-server,
+# a fake webdriver, an SMTP sink and a temporary sqlite database
+# usage: python -m benchmarks.load_test [--users 100] [--dramas 500] [--episodes 40] [--output result.json]
+#        python -m benchmarks.load_test --baseline result.json [--tolerance 0.2]
+# with --baseline it exits with 1 if any stage lost more than tolerance of its throughput
+import argparse
+import atexit
+from hashlib import md5
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import random
+import resource
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+from threading import Lock, Thread, current_thread, enumerate as enumerate_threads
+import time
+from urllib.parse import parse_qs, urlparse
+from urllib.request import urlopen
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STAGES = ('follow', 'chase_cold', 'chase_changed', 'outbox', 'index')
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def get_peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def get_percentile(latencies, q):
+    if len(latencies) == 0:
+        return None
+    latencies = sorted(latencies)
+    return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+
+# detail pages of dramas d0..d{dramas - 1}, every drama has episodes episodes
+# plus the ones added by add_episode, pages of browser_only dramas only get
+# their media list when the fake webdriver asks for them with render=1
+class FakeIFVODServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, episodes, latency, page_kb, browser_only):
+        super().__init__(('127.0.0.1', 0), FakeIFVODHandler)
+        self.episodes = episodes
+        self.latency = latency
+        self.padding = 'x' * (page_kb * 1024)
+        self.browser_only = browser_only
+        self.added = {}
+        self.requests = 0
+        self.lock = Lock()
+
+    @property
+    def base_url(self):
+        return 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+    # clients hang up as soon as they have read the media list
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def add_episode(self, site_id):
+        with self.lock:
+            self.added[site_id] = self.added.get(site_id, 0) + 1
+
+    def get_page(self, site_id, render):
+        episodes = self.episodes + self.added.get(site_id, 0)
+        links = ''.join(
+            '<li><a href="/play?id={0}e{1}">Episode {1}</a></li>'.format(site_id, i) for i in range(episodes))
+        media_list = '' if site_id in self.browser_only and not render else \
+            '<app-media-list class="media-list"><ul>{}</ul></app-media-list>'.format(links)
+        page = '<html><head><title>Drama {0} - IFVOD</title>' \
+            '<meta name="title" content="Drama {0} - IFVOD" /></head><body>{1}<div>{2}</div></body></html>'.format(
+                site_id, media_list, self.padding)
+        return page, '"{}"'.format(md5(page.encode('utf-8')).hexdigest())
+
+
+class FakeIFVODHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        with self.server.lock:
+            self.server.requests += 1
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path != '/detail' or 'id' not in query:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        page, etag = self.server.get_page(query['id'][0], 'render' in query)
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = page.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+# accepts any mail and only counts it
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPSinkHandler)
+        self.messages = 0
+        self.lock = Lock()
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.wfile.write(b'220 sink ESMTP\r\n')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command == b'DATA':
+                self.wfile.write(b'354 End data with <CR><LF>.<CR><LF>\r\n')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                with self.server.lock:
+                    self.server.messages += 1
+                self.wfile.write(b'250 OK\r\n')
+            elif command == b'QUIT':
+                self.wfile.write(b'221 Bye\r\n')
+                return
+            else:
+                self.wfile.write(b'250 OK\r\n')
+
+
+class FakeElement:
+    def __init__(self, html):
+        self.__html = html
+
+    def get_attribute(self, name):
+        return self.__html
+
+
+# renders pages by asking the fake ifvod server for the full page
+class FakeDriver:
+    def __init__(self):
+        self.title = ''
+        self.page_source = ''
+
+    def set_page_load_timeout(self, timeout):
+        self.__timeout = timeout
+
+    def get(self, url):
+        with urlopen(url + '&render=1', timeout=self.__timeout) as response:
+            self.page_source = response.read().decode('utf-8')
+        self.title = self.page_source.split('<title>', 1)[1].split('</title>', 1)[0]
+
+    def find_elements(self, by, tag_name):
+        start = self.page_source.find('<' + tag_name)
+        if start < 0:
+            return []
+        return [FakeElement(self.page_source[start:self.page_source.find('</' + tag_name, start)])]
+
+    def quit(self):
+        pass
+
+
+def start_redis(redis_server):
+    port = get_free_port()
+    process = subprocess.Popen(
+        [redis_server, '--port', str(port), '--save', '', '--appendonly', 'no'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return process, port
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError('{} did not start'.format(redis_server))
+
+
+def start_server(server):
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def stop_redis(process):
+    process.terminate()
+    process.wait()
+
+
+# stage result, latencies in seconds
+def make_result(seconds, items, latencies=None, histogram=None):
+    result = {
+        'seconds': round(seconds, 3),
+        'items': items,
+        'throughput': round(items / seconds, 2) if seconds > 0 else None,
+        'peak_rss_mb': round(get_peak_rss_mb(), 1)
+    }
+    if latencies is not None:
+        result['p50_ms'] = round(get_percentile(latencies, 0.5) * 1000, 2) if latencies else None
+        result['p99_ms'] = round(get_percentile(latencies, 0.99) * 1000, 2) if latencies else None
+    elif histogram is not None:
+        # bucket upper bounds of the metrics histogram
+        result['p50_ms'] = None if histogram['p50'] is None else histogram['p50'] * 1000
+        result['p99_ms'] = None if histogram['p99'] is None else histogram['p99'] * 1000
+    return result
+
+
+def run(args, ifvod, smtp):
+    import chaser
+    from core import app, db, dramas, redis_client
+    from core.models import User
+    from core.outbox import Outbox
+    from metrics import LAST_RUN_KEY, metrics
+    from scraper import browser
+    from scraper.providers import IFVODProvider
+
+    # point the ifvod provider and the browser pool at the stand-ins
+    dramas.PROVIDERS[dramas.VOD.IFVOD] = type('LocalIFVODProvider', (IFVODProvider,), {
+        'base_url': ifvod.base_url,
+        'domain': urlparse(ifvod.base_url).netloc
+    })
+
+    class FakeBrowserPool(browser.BrowserPool):
+        def __init__(self, **kwargs):
+            super().__init__(driver_factory=FakeDriver, **kwargs)
+    browser.BrowserPool = FakeBrowserPool
+
+    rand = random.Random(args.seed)
+    drama_ids = ['d{}'.format(i) for i in range(args.dramas)]
+    emails = ['user{}@bench.local'.format(i) for i in range(args.users)]
+    with app.app_context():
+        db.create_all()
+        for i, email in enumerate(emails):
+            db.session.add(User(username='user{}'.format(i), email=email))
+        db.session.commit()
+        user_ids = [user.id for user in User.query.all()]
+    results = {}
+    library = dramas.DramaLibrary()
+
+    # every user follows args.follows random dramas, every drama gets a follower
+    follows = [(emails[i % len(emails)], drama_id) for i, drama_id in enumerate(drama_ids)]
+    for email in emails:
+        follows += [(email, drama_id) for drama_id in rand.sample(drama_ids, min(args.follows, len(drama_ids)))]
+    latencies = []
+    start = time.time()
+    for email, drama_id in follows:
+        follow_start = time.time()
+        library.chase(email, drama_id, None)
+        latencies.append(time.time() - follow_start)
+    results['follow'] = make_result(time.time() - start, len(follows), latencies)
+
+    def chase(stage):
+        metrics.flush(redis_client)
+        requests = ifvod.requests
+        start = time.time()
+        chaser.scheduled_chase_all()
+        # the run flushes its metrics after saving them as the run summary
+        summary = json.loads(redis_client.get(LAST_RUN_KEY))
+        results[stage] = make_result(
+            time.time() - start, len(drama_ids),
+            histogram=summary['histograms'].get('http_request_seconds'))
+        results[stage]['server_requests'] = ifvod.requests - requests
+        results[stage]['counters'] = summary['counters']
+
+    chase('chase_cold')
+    # the scheduler would skip every drama until its next poll, make all of them due again
+    for drama_id in rand.sample(drama_ids, int(len(drama_ids) * args.changed_ratio)):
+        ifvod.add_episode(drama_id)
+    redis_client.delete('schedule')
+    chase('chase_changed')
+
+    metrics.flush(redis_client)
+    outbox = Outbox(
+        redis_client,
+        max_deliveries=app.config['OUTBOX_MAX_DELIVERIES'],
+        retry_after=app.config['OUTBOX_RETRY_AFTER'])
+    start = time.time()
+    while outbox.deliver('bench', count=args.outbox_batch) != 0:
+        pass
+    results['outbox'] = make_result(
+        time.time() - start, smtp.messages, histogram=metrics.summary()['histograms'].get('smtp_send_seconds'))
+
+    latencies = []
+    lock = Lock()
+
+    def browse(requests):
+        client = app.test_client()
+        for _ in range(requests):
+            with client.session_transaction() as session:
+                session['_user_id'] = str(rand.choice(user_ids))
+                session['_fresh'] = True
+            request_start = time.time()
+            response = client.get('/index')
+            with lock:
+                latencies.append(time.time() - request_start)
+            if response.status_code != 200:
+                raise RuntimeError('GET /index returned {}'.format(response.status_code))
+
+    threads = [Thread(target=browse, args=(args.requests // args.clients,)) for _ in range(args.clients)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results['index'] = make_result(time.time() - start, len(latencies), latencies)
+    return results
+
+
+# stages whose throughput dropped by more than tolerance
+def find_regressions(results, baseline, tolerance):
+    regressions = []
+    for stage in STAGES:
+        old = baseline.get('stages', {}).get(stage, {}).get('throughput')
+        new = results.get(stage, {}).get('throughput')
+        if old and new is not None and new < old * (1 - tolerance):
+            regressions.append('{}: {:.2f}/s, baseline {:.2f}/s'.format(stage, new, old))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline load test of DramaChaser')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--dramas', type=int, default=500)
+    parser.add_argument('--episodes', type=int, default=40)
+    parser.add_argument('--follows', type=int, default=10, help='dramas followed per user')
+    parser.add_argument('--latency-ms', type=float, default=50, help='fake ifvod response delay')
+    parser.add_argument('--page-kb', type=int, default=50, help='padding of every detail page')
+    parser.add_argument('--browser-ratio', type=float, default=0.05, help='dramas which need a browser')
+    parser.add_argument('--changed-ratio', type=float, default=0.2, help='dramas with a new episode in run 2')
+    parser.add_argument('--requests', type=int, default=500, help='GET /index requests')
+    parser.add_argument('--clients', type=int, default=4, help='concurrent index clients')
+    parser.add_argument('--outbox-batch', type=int, default=100)
+    parser.add_argument('--rate', type=float, default=10000, help='ifvod requests per second allowed by the throttle')
+    parser.add_argument('--redis-server', default='redis-server')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the results as json')
+    parser.add_argument('--baseline', help='results json of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    browser_only = set('d{}'.format(i) for i in range(int(args.dramas * args.browser_ratio)))
+    ifvod = start_server(FakeIFVODServer(args.episodes, args.latency_ms / 1000.0, args.page_kb, browser_only))
+    smtp = start_server(SMTPSink())
+    redis_process, redis_port = start_redis(args.redis_server)
+    # registered before the web app registers its exit flush of metrics, so it runs after it
+    atexit.register(stop_redis, redis_process)
+    tmpdir = tempfile.mkdtemp(prefix='dramachaser-bench-')
+    # the app writes logs/ to the working directory
+    sys.path.insert(0, ROOT)
+    os.chdir(tmpdir)
+    # config is read when core is imported
+    os.environ.update({
+        'DATABASE_URL': 'sqlite:///' + os.path.join(tmpdir, 'bench.db'),
+        'REDIS_HOST': '127.0.0.1',
+        'REDIS_PORT': str(redis_port),
+        'REDIS_DB': '0',
+        'MAIL_SERVER': '127.0.0.1',
+        'MAIL_PORT': str(smtp.server_address[1]),
+        'MAIL_MAX_PER_SECOND': '100000',
+        'IFVOD_RATE': str(args.rate),
+        'IFVOD_BURST': str(int(args.rate)),
+        'ACTIVITY_NO_SHUTDOWN_FLUSH': '1'
+    })
+    stages = run(args, ifvod, smtp)
+    # names of dramas shown on the index page load in background threads
+    for thread in enumerate_threads():
+        if thread is not current_thread() and not thread.daemon:
+            thread.join()
+    results = {'workload': vars(args), 'stages': stages}
+    print('{:<14} {:>9} {:>7} {:>10} {:>9} {:>9} {:>8}'.format(
+        'stage', 'seconds', 'items', 'items/s', 'p50 ms', 'p99 ms', 'rss MB'))
+    for stage in STAGES:
+        result = stages[stage]
+        print('{:<14} {:>9} {:>7} {:>10} {:>9} {:>9} {:>8}'.format(*[
+            '-' if value is None else value for value in (
+                stage, result['seconds'], result['items'], result['throughput'],
+                result.get('p50_ms'), result.get('p99_ms'), result['peak_rss_mb'])]))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(stages, json.load(f), args.tolerance)
+        for regression in regressions:
+            print('Regression in {}'.format(regression))
+        if len(regressions) != 0:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
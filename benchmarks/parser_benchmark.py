@@ -0,0 +1,43 @@
+# compare the old regex episode parsing with scraper.parser
+# usage: python -m benchmarks.parser_benchmark [saved ifvod detail pages...]
+# the saved pages of tests/fixtures are used when no page is given
+# parse times a page whose media list changed, find one which is only hashed
+import glob
+import os
+import re
+import sys
+import timeit
+from scraper.parser import ParseError, find_media_list, parse_media_list
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests', 'fixtures')
+
+
+def regex_parse(page):
+    match_obj = re.search('<app-media-list.*?>(.*?)</app-media-list>', page, re.DOTALL)
+    return re.findall(r'\"/play\?id=(.*?)\">(.*?)</a>', match_obj.group(1))
+
+
+def regex_find(page):
+    return re.search('<app-media-list.*?>(.*?)</app-media-list>', page, re.DOTALL).group(1)
+
+
+def main():
+    paths = sys.argv[1:] or sorted(glob.glob(os.path.join(FIXTURES, 'ifvod_detail_*.html')))
+    for path in paths:
+        name = os.path.basename(path)
+        with open(path, encoding='utf-8') as f:
+            page = f.read()
+        try:
+            episodes = len(parse_media_list(page))
+        except ParseError as ex:
+            print('{} skipped: {}'.format(name, ex))
+            continue
+        for parser_name, parse in [
+                ('regex parse', regex_parse), ('parser parse', parse_media_list),
+                ('regex find', regex_find), ('parser find', find_media_list)]:
+            seconds = min(timeit.repeat(lambda: parse(page), number=10, repeat=3)) / 10
+            print('{} {:<12} {} episodes: {:.3f}ms'.format(name, parser_name, episodes, seconds * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,208 +1,644 @@
-from selenium import webdriver
 import time
+import random
+import argparse
 import redis
-import re
-from enum import Enum
-import smtplib
+import hashlib
 import logging
-import configparser
 import pickle
-from core import app, mail
-from core.email import send_email
+import json
+from core import app, redis_client
+from core.dramas import (
+    DRAMA_VERSION, PROVIDERS, VOD, DramaLibrary, decode_show_list, encode_show_list, new_provider,
+    new_scheduler, new_throttle, transform_showlist_to_urls)
+from core.live import broker
+from core.outbox import Outbox
 from flask import render_template
-import requests
-
-class VOD(Enum):
-    IFVOD = 1
-
-class DRAMAOP(Enum):
-    CHASE = 1
-    ABANDON = 2
+from markupsafe import Markup
+from metrics import LAST_RUN_KEY, metrics
+from scraper.diff import diff_show_lists
+from scraper.lease import LeaseManager
+from scraper.parser import ParseError
+from scraper.providers import FetchStrategy
+# the scraping engine of the cron job, the web app reads dramas through
+# core.dramas and never imports this module, requests, selenium and asyncio
+# are imported where they are used
 
 class DramaChaser:
     def __init__(self, vod = VOD.IFVOD):
-        self.__redis_client = redis.Redis(host='localhost', port=6379, db=0)
-        if vod != VOD.IFVOD:
-            raise Exception('Other type of VOD is not implemented yet')
-
-    @staticmethod
-    def __get_all_users_key():
-        return 'users' 
+        if vod not in PROVIDERS:
+            raise Exception('VOD {} is not implemented yet'.format(vod.name))
+        self.__redis_client = redis_client
+        self.__scheduler = new_scheduler()
+        self.__library = DramaLibrary()
+        # only dramas of vod are scraped
+        self.__vod = vod
+        self.__provider = new_provider(vod)
+        self.__throttle = new_throttle(self.__provider)
+        self.__outbox = Outbox(
+            self.__redis_client,
+            max_deliveries=app.config['OUTBOX_MAX_DELIVERIES'],
+            retry_after=app.config['OUTBOX_RETRY_AFTER'])
 
+    # key => {drama_id}:metadata, pickled metadata of old releases
     @staticmethod
     def __get_metadata_key(drama_id):
         return "{}:metadata".format(drama_id)
 
-    def __get_all_users(self):
-        return self.__redis_client.smembers(DramaChaser.__get_all_users_key())
-
-    def __get_drama_ids(self, user_id):
-        return self.__redis_client.smembers(user_id)
+    # dramas whose delta has not been queued for delivery yet
+    @staticmethod
+    def __get_changed_dramas_key():
+        return 'changed_dramas'
 
+    # only newly added episodes are reported, a drama seen for the first time has no delta
     @staticmethod
     def __get_delta_show_list(current_show_list, old_show_list):
-        return [] if old_show_list is None else filter(lambda x: x not in old_show_list, current_show_list)
+        if old_show_list is None:
+            return []
+        diff = diff_show_lists(current_show_list, old_show_list)
+        if len(diff.removed) != 0 or len(diff.renamed) != 0:
+            logging.info('{} episodes removed, {} renamed'.format(len(diff.removed), len(diff.renamed)))
+        return diff.added
 
-    def __get_drama_obj(self,drama_id):
-        serialized_drama_obj = self.__redis_client.get(drama_id)
-        return None if serialized_drama_obj is None else pickle.loads(serialized_drama_obj)
+    # followed dramas of this chaser's vod
+    def __get_followed_drama_ids(self):
+        return [
+            drama_id for drama_id in self.__library.get_followed_drama_ids()
+            if self.__library.find_vod(drama_id) == self.__vod
+        ]
 
+    # missing validators are stored as empty strings
     @staticmethod
-    def __get_drama_url(drama_id):
-        return "https://www.ifvod.tv/detail?id={}".format(drama_id)
+    def __encode_validators(validators):
+        return {field: validators.get(field) or '' for field in ('etag', 'last_modified', 'content_hash')}
 
     @staticmethod
-    def __get_play_url(play_id):
-        return "https://www.ifvod.tv/play?id={}".format(play_id) 
+    def __decode_validators(values):
+        return {
+            field: value.decode('utf-8')
+            for field, value in zip(('etag', 'last_modified', 'content_hash'), values) if value
+        }
 
-    @staticmethod
-    def __parse_ifvod_page(page):
-        try:
-            match_obj = re.search('<app-media-list.*?>(.*?)</app-media-list>', page)
-            return re.findall(r'\"/play\?id=(.*?)\">(.*?)</a>', match_obj.group(1))
-        except Exception as ex:
-            logging.error(ex)
+    def __get_all_validators(self, drama_ids):
+        pipe = self.__redis_client.pipeline(transaction=False)
+        for drama_id in drama_ids:
+            pipe.hmget(drama_id, 'etag', 'last_modified', 'content_hash')
+        return {drama_id: DramaChaser.__decode_validators(values) for drama_id, values in zip(drama_ids, pipe.execute())}
+
+    def __set_validators(self, drama_id, validators):
+        mapping = DramaChaser.__encode_validators(validators)
+        mapping['version'] = DRAMA_VERSION
+        self.__redis_client.hset(drama_id, mapping=mapping)
 
     @staticmethod
-    def __get_current_show_list(drama_id):
-        driver = webdriver.Chrome()
+    def __get_content_hash(markup):
+        return hashlib.sha1(markup.encode('utf-8')).hexdigest()
+
+    # hash the raw episode list markup into validators and only parse it if the
+    # hash changed since the last poll, returns None if it didn't
+    # raises ParseError if the markup has no episodes
+    def __parse_if_changed(self, markup, validators, old_validators):
+        validators['content_hash'] = DramaChaser.__get_content_hash(markup)
+        if validators['content_hash'] == old_validators.get('content_hash'):
+            return None
+        with self.__timer('parse'):
+            show_list = self.__provider.parse_show_list(markup)
+        if len(show_list) == 0:
+            raise ParseError('No episodes found')
+        return show_list
+
+    # episode list markup of a page streamed by scraper.fetch, None if it has none
+    def __read_show_list(self, chunks):
         try:
-            driver.get(DramaChaser.__get_drama_url(drama_id))
-            # wait to load all pages
-            time.sleep(5)
-            return DramaChaser.__parse_ifvod_page(driver.page_source)
-        finally:            
-            driver.close()
-
-    # load drama name from DB, parse webpage if failed
-    def load_drama_name(self, drama_id):
-        metadata_key = DramaChaser.__get_metadata_key(drama_id)
-        response = self.__redis_client.get(metadata_key)
-        if response is not None:
-            return pickle.loads(response)['drama_name']
-        url = DramaChaser.__get_drama_url(drama_id)
-        page = requests.get(url)
-        drama_name = DramaChaser.__parse_metadata_page(page.text)
-        payload = {}
-        payload['drama_name'] = drama_name
-        self.__redis_client.set(metadata_key, pickle.dumps(payload))
-        return drama_name
+            return self.__provider.find_show_list(chunks)
+        except ParseError:
+            return None
 
-    @staticmethod
-    def __parse_metadata_page(page):
-        match_obj = re.search('<meta.*?name="title".*?content="(.*?) - IFVOD".*?/>', page)
-        return match_obj.group(1)
+    # scrape dramas concurrently, yield (drama_id, current_show_list, validators)
+    # as they complete, dramas whose page or media list didn't change are skipped
+    # plain http is tried first, a browser is only started for pages it can't parse
+    # or for every page if the provider prefers browsers
+    def __get_current_show_lists(self, drama_ids):
+        from scraper import fetch
+        drama_ids = list(drama_ids)
+        urls = {drama_id: self.__provider.get_episodes_url(drama_id) for drama_id in drama_ids}
+        old_validators = self.__get_all_validators(drama_ids)
+        http_urls = urls
+        fallback_drama_ids = []
+        if self.__provider.fetch_strategy == FetchStrategy.BROWSER:
+            http_urls, fallback_drama_ids = {}, drama_ids
+        # pages are only read up to the end of the episode list
+        for drama_id, markup, validators in fetch.fetch_all(
+                http_urls, old_validators, self.__provider.pool_size, app.config['SCRAPER_HTTP_TIMEOUT'],
+                self.__throttle, read=self.__read_show_list):
+            if markup is fetch.NOT_MODIFIED:
+                self.__count_page('http', 'not_modified')
+                continue
+            try:
+                if markup is None:
+                    raise ParseError('No episode list')
+                current_show_list = self.__parse_if_changed(markup, validators, old_validators[drama_id])
+            except ParseError:
+                self.__count_page('http', 'failed' if validators is None else 'unparsable')
+                fallback_drama_ids.append(drama_id)
+                continue
+            if current_show_list is None:
+                self.__count_page('http', 'unchanged')
+                self.__set_validators(drama_id, validators)
+            else:
+                self.__count_page('http', 'changed')
+                yield drama_id, current_show_list, validators
+        if len(fallback_drama_ids) == 0:
+            return
+        urls = {drama_id: urls[drama_id] for drama_id in fallback_drama_ids}
+        loaded = 0
+        with self.__new_browser_pool() as pool:
+            for drama_id, page in pool.fetch_all(urls, wait=self.__get_page_wait()):
+                loaded += 1
+                logging.info('Loaded drama {} in {:.2f}s'.format(drama_id, pool.timings[drama_id]))
+                # http validators are dropped so the next run doesn't trust a 304
+                # for a page plain http can't parse
+                validators = {}
+                try:
+                    current_show_list = self.__parse_if_changed(
+                        self.__provider.find_show_list(page), validators, old_validators[drama_id])
+                except ParseError as ex:
+                    self.__count_page('browser', 'unparsable')
+                    logging.error('Failed to parse drama {}: {}'.format(drama_id, ex))
+                    continue
+                if current_show_list is None:
+                    self.__count_page('browser', 'unchanged')
+                else:
+                    self.__count_page('browser', 'changed')
+                    yield drama_id, current_show_list, validators
+        self.__count_page('browser', 'failed', len(urls) - loaded)
+        for seconds in pool.timings.values():
+            metrics.observe('page_load_seconds', seconds, vod=self.__provider.name)
+        self.__record_browser_pool(pool)
 
-    @staticmethod
-    def __parse_resource_id(link):
-        match_obj = re.search('id=(.*?)">', link)
-        return match_obj.group(1)
+    # count a scraped page by how it went, result is one of
+    # not_modified, unchanged, changed, unparsable and failed
+    def __count_page(self, strategy, result, count=1):
+        metrics.incr('pages_fetched_total', count, vod=self.__provider.name, strategy=strategy, result=result)
+
+    def __record_browser_pool(self, pool):
+        metrics.set('browser_peak_memory_bytes', pool.peak_memory, vod=self.__provider.name)
+
+    def __new_browser_pool(self):
+        from scraper.browser import BrowserPool
+        return BrowserPool(
+            size=self.__provider.pool_size,
+            max_pages=app.config['SCRAPER_MAX_PAGES_PER_BROWSER'],
+            page_load_timeout=app.config['SCRAPER_PAGE_TIMEOUT'],
+            throttle=self.__throttle)
+
+    def __get_page_wait(self):
+        from scraper.browser import wait_until_stable
+        return wait_until_stable(self.__provider.wait_tag, app.config['SCRAPER_PAGE_TIMEOUT'])
 
     # key => drama_id
-    # value => dict {
-    #   last_updated_time:<last_updated_time>, 
-    #   current_show_list:<current_show_list>, 
-    #   delta_show_list:<delta_show_list>
+    # value => hash {
+    #   version:<DRAMA_VERSION>,
+    #   drama_name:<drama_name>,
+    #   name_updated_time:<time drama_name was fetched>,
+    #   last_updated_time:<last_updated_time>,
+    #   current_show_list:<json current_show_list>,
+    #   delta_show_list:<json delta_show_list>,
+    #   etag:<etag>,
+    #   last_modified:<last_modified>,
+    #   content_hash:<hash of app-media-list>
     # }
-    def __get_drama_updates(self, drama_id):
-        old_obj = self.__get_drama_obj(drama_id)
-        if old_obj is not None and time.time() - old_obj['last_updated_time'] <= 3600:
-            return old_obj['delta_show_list']
-        current_show_list = DramaChaser.__get_current_show_list(drama_id)
-        old_show_list = old_obj['current_show_list'] if old_obj is not None else None
-        delta_show_list = DramaChaser.__get_delta_show_list(current_show_list, old_show_list)
-        obj = {}
-        obj['last_updated_time'] = time.time()
-        obj['current_show_list'] = current_show_list
-        obj['delta_show_list'] = delta_show_list
-        self.__redis_client.set(drama_id, pickle.dumps(obj))
+    def __get_drama_updates(self, drama_id, current_show_list, validators):
+        with self.__timer('store'):
+            return self.__store_drama_updates(drama_id, current_show_list, validators)
+
+    # episodes of delta_show_list which are not pending delivery yet are appended to pending_show_list
+    @staticmethod
+    def __merge_delta_show_lists(pending_show_list, delta_show_list):
+        pending_play_ids = {play_id for play_id, _ in pending_show_list}
+        return pending_show_list + [show for show in delta_show_list if show[0] not in pending_play_ids]
+
+    # returns the episodes added since the previous scrape, a delta which is
+    # still waiting for delivery is extended instead of overwritten
+    def __store_drama_updates(self, drama_id, current_show_list, validators):
+        changed_dramas_key = DramaChaser.__get_changed_dramas_key()
+        pipe = self.__redis_client.pipeline()
+        while True:
+            try:
+                # notify clears the changed flag, a concurrent scrape rewrites the drama
+                pipe.watch(drama_id, changed_dramas_key)
+                old_show_list, pending_show_list = pipe.hmget(drama_id, 'current_show_list', 'delta_show_list')
+                old_show_list = decode_show_list(old_show_list)
+                delta_show_list = DramaChaser.__get_delta_show_list(current_show_list, old_show_list)
+                stored_show_list = delta_show_list
+                if pipe.sismember(changed_dramas_key, drama_id):
+                    stored_show_list = DramaChaser.__merge_delta_show_lists(
+                        decode_show_list(pending_show_list) or [], delta_show_list)
+                mapping = DramaChaser.__encode_validators(validators)
+                mapping['version'] = DRAMA_VERSION
+                mapping['last_updated_time'] = time.time()
+                mapping['current_show_list'] = encode_show_list(current_show_list)
+                mapping['delta_show_list'] = encode_show_list(stored_show_list)
+                pipe.multi()
+                pipe.hset(drama_id, mapping=mapping)
+                if len(stored_show_list) != 0:
+                    pipe.sadd(changed_dramas_key, drama_id)
+                # open index pages patch the row of the drama
+                broker.publish(
+                    drama_id, self.__provider.get_metadata_url(drama_id),
+                    transform_showlist_to_urls(self.__provider, current_show_list), pipe=pipe)
+                pipe.execute()
+                break
+            except redis.WatchError:
+                continue
+            finally:
+                pipe.reset()
+        if len(delta_show_list) != 0:
+            metrics.incr('changed_dramas_total', vod=self.__provider.name)
         return delta_show_list
 
-    def __get_all_drama_reports(self, user_id):
-        drama_ids = self.__get_drama_ids(user_id)
-        reports = {}
-        if not isinstance(drama_ids, set):
-            return reports
-    
-        for drama_id in drama_ids:
-            updates = self.__get_drama_updates(drama_id)
+    # scrape every distinct drama exactly once, return ids of changed dramas
+    def __get_all_drama_updates(self, drama_ids):
+        changed_drama_ids = set()
+        for drama_id, current_show_list, validators in self.__get_current_show_lists(drama_ids):
+            updates = self.__get_drama_updates(drama_id, current_show_list, validators)
             if len(updates) != 0:
-                drama_name = self.load_drama_name(drama_id)
-                reports[drama_name] = updates
-        return reports
+                changed_drama_ids.add(drama_id)
+        return changed_drama_ids
 
-    def __notify_user_by_email(self, email, reports):
-        if len(reports) == 0:
-            return
+    # key => drama_id, value => (drama_name, delta_show_list)
+    # watch_pipe watches the changed dramas so a delta extended meanwhile aborts the transaction
+    def __get_changed_drama_updates(self, watch_pipe):
+        changed_drama_ids = [
+            drama_id.decode('utf-8') for drama_id in watch_pipe.smembers(DramaChaser.__get_changed_dramas_key())
+        ]
+        if len(changed_drama_ids) != 0:
+            watch_pipe.watch(*changed_drama_ids)
+        pipe = self.__redis_client.pipeline(transaction=False)
+        for drama_id in changed_drama_ids:
+            pipe.hmget(drama_id, 'drama_name', 'delta_show_list')
+        drama_updates = {}
+        for drama_id, (drama_name, delta_show_list) in zip(changed_drama_ids, pipe.execute()):
+            drama_name = self.__library.load_drama_name(drama_id) if drama_name is None else drama_name.decode('utf-8')
+            drama_updates[drama_id] = (drama_name, decode_show_list(delta_show_list))
+        return drama_updates
+
+    # render the part of the email about each changed drama once
+    # key => drama_id, value => (text_report, html_report)
+    @staticmethod
+    def __render_drama_reports(drama_updates):
+        drama_reports = {}
+        for drama_id, (drama_name, updates) in drama_updates.items():
+            # renames and removals leave nothing to report
+            if not updates:
+                continue
+            drama_reports[drama_id] = (
+                render_template('email/drama_report.txt', drama=drama_name, showlist=updates),
+                Markup(render_template('email/drama_report.html', drama=drama_name, showlist=updates)))
+        return drama_reports
+
+    def __render_emails(self, drama_updates):
+        user_drama_ids = self.__library.get_followers_of_dramas(list(drama_updates.keys()))
+        emails = []
         with app.app_context():
-            send_email(
-                '[DramaChaser] Drama updates',
-                sender=app.config['ADMINS'][0], 
-                recipients=[email],
-                text_body=render_template('email/drama_updates.txt', reports=reports),
-                html_body=render_template('email/drama_updates.html', reports=reports)
-            ) 
-            
-    def __update_drama(self, user_id, op, drama_id):
+            drama_reports = DramaChaser.__render_drama_reports(drama_updates)
+            for email, drama_ids in user_drama_ids.items():
+                reports = [drama_reports[drama_id] for drama_id in drama_ids if drama_id in drama_reports]
+                if len(reports) == 0:
+                    continue
+                emails.append(dict(
+                    subject='[DramaChaser] Drama updates',
+                    sender=app.config['ADMINS'][0],
+                    recipients=[email],
+                    text_body=render_template('email/drama_updates.txt', reports=[report[0] for report in reports]),
+                    html_body=render_template('email/drama_updates.html', reports=[report[1] for report in reports])
+                ))
+        return emails
+
+    # queue emails to followers of all changed dramas and clear their changed flag atomically,
+    # delivery happens in `flask outbox work`
+    def __notify_followers_by_email(self):
         pipe = self.__redis_client.pipeline()
         while True:
             try:
-                pipe.watch(user_id)
+                # concurrent workers must not queue the same delta twice
+                pipe.watch(DramaChaser.__get_changed_dramas_key())
+                drama_updates = self.__get_changed_drama_updates(pipe)
+                if len(drama_updates) == 0:
+                    return
+                emails = self.__render_emails(drama_updates)
                 pipe.multi()
-                if op == DRAMAOP.CHASE:
-                    pipe.sadd(user_id, drama_id) # user to drama mapping
-                    pipe.sadd(DramaChaser.__get_all_users_key(), user_id) # all users mapping
-                else:
-                    pipe.srem(user_id, drama_id)
+                for email in emails:
+                    self.__outbox.enqueue(pipe=pipe, **email)
+                pipe.srem(DramaChaser.__get_changed_dramas_key(), *drama_updates.keys())
                 pipe.execute()
+                metrics.incr('emails_queued_total', len(emails))
                 break
             except redis.WatchError:
                 continue
             finally:
                 pipe.reset()
-    
-    # chase a drama from UI
-    def chase(self, user_id, drama_id, drama_name):
-        self.__update_drama(user_id, DRAMAOP.CHASE, drama_id)
-    
-    # abandon a drama from UI
-    def abandon(self, user_id, drama_link):
-        drama_id = DramaChaser.__parse_resource_id(drama_link)
-        self.__update_drama(user_id, DRAMAOP.ABANDON, drama_id)
+        logging.info('Queued emails for {} changed dramas'.format(len(drama_updates)))
 
     # complete drama information in cron job
+    # process due dramas in chunks under leases so that several cron workers can
+    # share a run, dramas leased by others are retried until the owner reschedules
+    # them or the lease of a dead owner expires
+    def __chase_due_dramas(self, due_drama_ids):
+        batch_size = app.config['LEASE_BATCH_SIZE']
+        pending_drama_ids = list(due_drama_ids)
+        with LeaseManager(self.__redis_client, ttl=app.config['LEASE_TTL']) as leases:
+            while len(pending_drama_ids) != 0:
+                # spread workers over different dramas
+                random.shuffle(pending_drama_ids)
+                processed = 0
+                for i in range(0, len(pending_drama_ids), batch_size):
+                    claimed_drama_ids = leases.acquire_all(pending_drama_ids[i:i + batch_size])
+                    # another worker may have finished them before we got the lease
+                    drama_ids = self.__scheduler.get_due(claimed_drama_ids)
+                    changed_drama_ids = self.__get_all_drama_updates(drama_ids)
+                    self.__scheduler.reschedule(drama_ids, changed_drama_ids)
+                    leases.release_all(claimed_drama_ids)
+                    processed += len(drama_ids)
+                pending_drama_ids = self.__scheduler.get_due(pending_drama_ids)
+                if processed == 0 and len(pending_drama_ids) != 0:
+                    logging.info('Waiting for leases on {} dramas'.format(len(pending_drama_ids)))
+                    time.sleep(app.config['LEASE_RETRY_INTERVAL'])
+
+    def __timer(self, stage):
+        return metrics.timer('stage_seconds', stage=stage, vod=self.__provider.name)
+
     def scheduled_chase(self):
-        all_users = self.__get_all_users()
-        if not isinstance(all_users, set):
-            logging.info('No user chase drama, exit')
-            return
-        for user in all_users:
-            reports = self.__get_all_drama_reports(user)
-            self.__notify_user_by_email(user, reports)
+        with self.__timer('run'):
+            # deltas left by an interrupted run are queued before they can be overwritten
+            with self.__timer('notify'):
+                self.__notify_followers_by_email()
+            followed_drama_ids = self.__get_followed_drama_ids()
+            if len(followed_drama_ids) == 0:
+                logging.info('No user chase drama, exit')
+                return
+            # phase 1: scrape each distinct drama which is due once
+            due_drama_ids = self.__scheduler.get_due(followed_drama_ids)
+            logging.info('{} of {} dramas are due'.format(len(due_drama_ids), len(followed_drama_ids)))
+            metrics.incr('due_dramas_total', len(due_drama_ids), vod=self.__provider.name)
+            with self.__timer('chase'):
+                self.__chase_due_dramas(due_drama_ids)
+            # phase 2: fan out deltas to followers
+            with self.__timer('notify'):
+                self.__notify_followers_by_email()
 
-    @staticmethod
-    def __transform_showlist_to_urls(show_list):
-        if show_list is None:
-            return None
-        return [(DramaChaser.__get_play_url(show[0]), show[1]) for show in show_list]
+    # asyncio variant of scheduled_chase, dramas stream through bounded queues:
+    # due dramas -> http fetch and parse -> diff and store -> queue emails,
+    # pages http can't parse take a detour through the browser pool
+    async def async_scheduled_chase(self):
+        import asyncio
+        from concurrent.futures import ThreadPoolExecutor
+        from scraper import fetch
+        loop = asyncio.get_event_loop()
+        executor = ThreadPoolExecutor(max_workers=app.config['ASYNC_FETCH_CONCURRENCY'] + self.__provider.pool_size +
+                                      app.config['ASYNC_DIFF_CONCURRENCY'] + 1)
+        def run(fn, *args):
+            return loop.run_in_executor(executor, fn, *args)
 
-    @staticmethod
-    def __get_show_list(drama_obj):
-        return None if drama_obj is None else drama_obj['current_show_list']
+        start = time.time()
+        try:
+            await run(self.__notify_followers_by_email)
+            followed_drama_ids = await run(self.__get_followed_drama_ids)
+            due_drama_ids = await run(self.__scheduler.get_due, followed_drama_ids)
+            logging.info('{} of {} dramas are due'.format(len(due_drama_ids), len(followed_drama_ids)))
+            metrics.incr('due_dramas_total', len(due_drama_ids), vod=self.__provider.name)
+            with LeaseManager(self.__redis_client, ttl=app.config['LEASE_TTL']) as leases, \
+                    fetch.reserve_pool(app.config['ASYNC_FETCH_CONCURRENCY']):
+                await self.__async_chase_due_dramas(run, leases, due_drama_ids)
+            await run(self.__notify_followers_by_email)
+        finally:
+            executor.shutdown(wait=True)
+        metrics.observe('stage_seconds', time.time() - start, stage='run', vod=self.__provider.name)
+
+    # feed due dramas into the pipeline under leases like __chase_due_dramas,
+    # a drama is rescheduled and its lease released once it leaves the pipeline
+    # run => runs a blocking call in the executor of the pipeline
+    async def __async_chase_due_dramas(self, run, leases, due_drama_ids):
+        import asyncio
+        from scraper import fetch
+        batch_size = app.config['LEASE_BATCH_SIZE']
+        fetch_queue = asyncio.Queue(maxsize=app.config['ASYNC_QUEUE_SIZE'])
+        browser_queue = asyncio.Queue(maxsize=app.config['ASYNC_QUEUE_SIZE'])
+        diff_queue = asyncio.Queue(maxsize=app.config['ASYNC_QUEUE_SIZE'])
+        old_validators = {}
+        claimed_drama_ids = set()
+        changed_drama_ids = set()
+        finished_drama_ids = []
+        pool = self.__new_browser_pool()
+        wait = self.__get_page_wait()
+
+        # rescheduled before released, so other workers find them no longer due
+        async def finish():
+            drama_ids = finished_drama_ids[:]
+            del finished_drama_ids[:]
+            if len(drama_ids) == 0:
+                return
+            await run(self.__scheduler.reschedule, drama_ids, changed_drama_ids)
+            await run(leases.release_all, drama_ids)
+
+        # a worker must mark every item done whatever happens to it, or joining its queue hangs
+        async def fetch_worker():
+            while True:
+                drama_id = await fetch_queue.get()
+                handed_on = False
+                try:
+                    try:
+                        markup, validators = await run(
+                            fetch.get_page_if_modified, self.__provider.get_episodes_url(drama_id),
+                            old_validators[drama_id], app.config['SCRAPER_HTTP_TIMEOUT'], self.__throttle,
+                            self.__read_show_list)
+                    except Exception as ex:
+                        logging.error('Failed to fetch drama {}: {}'.format(drama_id, ex))
+                        markup, validators = None, None
+                    if markup is fetch.NOT_MODIFIED:
+                        self.__count_page('http', 'not_modified')
+                        continue
+                    try:
+                        if markup is None:
+                            raise ParseError('No episode list')
+                        current_show_list = self.__parse_if_changed(markup, validators, old_validators[drama_id])
+                    except ParseError:
+                        self.__count_page('http', 'failed' if validators is None else 'unparsable')
+                        await browser_queue.put(drama_id)
+                        handed_on = True
+                        continue
+                    if current_show_list is None:
+                        self.__count_page('http', 'unchanged')
+                        await run(self.__set_validators, drama_id, validators)
+                    else:
+                        self.__count_page('http', 'changed')
+                        await diff_queue.put((drama_id, current_show_list, validators))
+                        handed_on = True
+                except Exception as ex:
+                    logging.error('Failed to process drama {}: {}'.format(drama_id, ex))
+                finally:
+                    if not handed_on:
+                        finished_drama_ids.append(drama_id)
+                    fetch_queue.task_done()
+
+        async def browser_worker():
+            while True:
+                drama_id = await browser_queue.get()
+                handed_on = False
+                load_start = time.time()
+                try:
+                    page = await run(pool.fetch, self.__provider.get_episodes_url(drama_id), wait)
+                    metrics.observe('page_load_seconds', time.time() - load_start, vod=self.__provider.name)
+                    validators = {}
+                    current_show_list = self.__parse_if_changed(
+                        self.__provider.find_show_list(page), validators, old_validators[drama_id])
+                    if current_show_list is None:
+                        self.__count_page('browser', 'unchanged')
+                    else:
+                        self.__count_page('browser', 'changed')
+                        await diff_queue.put((drama_id, current_show_list, validators))
+                        handed_on = True
+                except Exception as ex:
+                    self.__count_page('browser', 'unparsable' if isinstance(ex, ParseError) else 'failed')
+                    logging.error('Failed to load drama {}: {}'.format(drama_id, ex))
+                finally:
+                    if not handed_on:
+                        finished_drama_ids.append(drama_id)
+                    browser_queue.task_done()
+
+        async def diff_worker():
+            while True:
+                drama_id, current_show_list, validators = await diff_queue.get()
+                try:
+                    updates = await run(self.__get_drama_updates, drama_id, current_show_list, validators)
+                    if len(updates) != 0:
+                        changed_drama_ids.add(drama_id)
+                except Exception as ex:
+                    logging.error('Failed to update drama {}: {}'.format(drama_id, ex))
+                finally:
+                    finished_drama_ids.append(drama_id)
+                    diff_queue.task_done()
 
-    # get all drama metadata for a user
-    def get_drama_metadata(self, user_id):
-        drama_ids = list(self.__get_drama_ids(user_id))
-        drama_metadata = {}
+        workers = [asyncio.ensure_future(fetch_worker()) for _ in range(app.config['ASYNC_FETCH_CONCURRENCY'])]
+        workers += [asyncio.ensure_future(browser_worker()) for _ in range(self.__provider.pool_size)]
+        workers += [asyncio.ensure_future(diff_worker()) for _ in range(app.config['ASYNC_DIFF_CONCURRENCY'])]
+        try:
+            # sites which prefer browsers skip the http stage
+            first_queue = fetch_queue
+            if self.__provider.fetch_strategy == FetchStrategy.BROWSER:
+                first_queue = browser_queue
+            pending_drama_ids = list(due_drama_ids)
+            while len(pending_drama_ids) != 0:
+                # spread workers over different dramas
+                random.shuffle(pending_drama_ids)
+                processed = 0
+                for i in range(0, len(pending_drama_ids), batch_size):
+                    claimed = await run(leases.acquire_all, pending_drama_ids[i:i + batch_size])
+                    # another worker may have finished them before we got the lease
+                    drama_ids = await run(self.__scheduler.get_due, claimed)
+                    await run(leases.release_all, list(set(claimed) - set(drama_ids)))
+                    old_validators.update(await run(self.__get_all_validators, drama_ids))
+                    claimed_drama_ids.update(drama_ids)
+                    for drama_id in drama_ids:
+                        await first_queue.put(drama_id)
+                    processed += len(drama_ids)
+                    await finish()
+                # dramas of ours still in the pipeline are not due for anyone else
+                pending_drama_ids = [
+                    drama_id for drama_id in await run(self.__scheduler.get_due, pending_drama_ids)
+                    if drama_id not in claimed_drama_ids
+                ]
+                if processed == 0 and len(pending_drama_ids) != 0:
+                    logging.info('Waiting for leases on {} dramas'.format(len(pending_drama_ids)))
+                    await asyncio.sleep(app.config['LEASE_RETRY_INTERVAL'])
+                    await finish()
+            # every stage only hands work downstream, join them in order
+            await fetch_queue.join()
+            await browser_queue.join()
+            await diff_queue.join()
+            await finish()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await run(pool.close)
+            self.__record_browser_pool(pool)
+
+    # convert pickled drama objects and {drama_id}:metadata keys to drama hashes
+    def migrate_pickled_dramas(self):
+        user_drama_ids = self.__library.get_drama_ids_of_all_users()
+        drama_ids = {drama_id.decode('utf-8') for drama_id in set().union(*user_drama_ids.values())}
+        for metadata_key in self.__redis_client.scan_iter(match=DramaChaser.__get_metadata_key('*')):
+            drama_ids.add(metadata_key.decode('utf-8').rsplit(':', 1)[0])
+        migrated = 0
         for drama_id in drama_ids:
-            payload = {}
-            drama_obj = self.__get_drama_obj(drama_id)
-            payload['show_list'] = DramaChaser.__transform_showlist_to_urls(DramaChaser.__get_show_list(drama_obj))
-            payload['drama_name'] = self.load_drama_name(drama_id)
-            drama_metadata[self.__get_drama_url(drama_id)] = payload
-        return drama_metadata
-    
+            mapping = {}
+            if self.__redis_client.type(drama_id) == b'string':
+                obj = pickle.loads(self.__redis_client.get(drama_id))
+                mapping['last_updated_time'] = obj['last_updated_time']
+                mapping['current_show_list'] = encode_show_list(obj['current_show_list'] or [])
+                mapping['delta_show_list'] = encode_show_list(list(obj['delta_show_list'] or []))
+            metadata_key = DramaChaser.__get_metadata_key(drama_id)
+            metadata = self.__redis_client.get(metadata_key)
+            if metadata is not None:
+                mapping['drama_name'] = pickle.loads(metadata)['drama_name']
+            if len(mapping) == 0:
+                continue
+            mapping['version'] = DRAMA_VERSION
+            pipe = self.__redis_client.pipeline()
+            pipe.delete(drama_id, metadata_key)
+            pipe.hset(drama_id, mapping=mapping)
+            pipe.execute()
+            migrated += 1
+        return migrated
+
+# log the metrics of a cron run, keep them as the latest run summary and
+# add them to the totals served by the web app
+def save_run_summary(started_time, failed_vods=()):
+    summary = metrics.summary()
+    summary['started_time'] = started_time
+    summary['finished_time'] = time.time()
+    summary['failed_vods'] = sorted(failed_vods)
+    summary = json.dumps(summary, sort_keys=True)
+    logging.info('Run summary: {}'.format(summary))
+    redis_client.set(LAST_RUN_KEY, summary)
+    metrics.flush(redis_client)
+
+# save the summary of a run whose vods failed with errors, a dict {vod: exception},
+# and raise the first error so that the cron job exits non-zero
+def finish_run(started_time, errors):
+    for vod, ex in errors.items():
+        logging.error('Failed to chase dramas of {}'.format(vod.name), exc_info=ex)
+    save_run_summary(started_time, [vod.name for vod in errors])
+    if len(errors) != 0:
+        raise next(iter(errors.values()))
+
+# chase dramas of every vod at once, each with its own browser pool and rate
+# limits, so one slow site doesn't hold back the others
+def scheduled_chase_all():
+    from concurrent.futures import ThreadPoolExecutor
+    started_time = time.time()
+    with ThreadPoolExecutor(max_workers=len(PROVIDERS)) as executor:
+        futures = {vod: executor.submit(DramaChaser(vod=vod).scheduled_chase) for vod in PROVIDERS}
+    finish_run(started_time, {
+        vod: future.exception() for vod, future in futures.items() if future.exception() is not None
+    })
+
+async def async_scheduled_chase_all():
+    import asyncio
+    started_time = time.time()
+    vods = list(PROVIDERS)
+    results = await asyncio.gather(
+        *[DramaChaser(vod=vod).async_scheduled_chase() for vod in vods], return_exceptions=True)
+    finish_run(started_time, {
+        vod: result for vod, result in zip(vods, results) if isinstance(result, BaseException)
+    })
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Chase dramas for all users')
+    parser.add_argument('--async', dest='use_async', action='store_true', help='run the asyncio pipeline')
+    args = parser.parse_args()
     logging.basicConfig(level=logging.INFO)
-    drama_chaser = DramaChaser(vod=VOD.IFVOD)
-    drama_chaser.scheduled_chase()
+    if args.use_async:
+        import asyncio
+        asyncio.run(async_scheduled_chase_all())
+    else:
+        scheduled_chase_all()
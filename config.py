@@ -11,4 +11,59 @@ class Config(object):
     MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS') is not None
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
-    ADMINS = ['james.cui.code@gmail.com']
\ No newline at end of file
+    ADMINS = ['james.cui.code@gmail.com']
+    MAIL_SENDER_WORKERS = int(os.environ.get('MAIL_SENDER_WORKERS') or 4)
+    MAIL_SEND_RETRIES = int(os.environ.get('MAIL_SEND_RETRIES') or 2)
+    MAIL_MAX_PER_SECOND = float(os.environ.get('MAIL_MAX_PER_SECOND') or 10)
+    OUTBOX_MAX_DELIVERIES = int(os.environ.get('OUTBOX_MAX_DELIVERIES') or 5)
+    OUTBOX_RETRY_AFTER = int(os.environ.get('OUTBOX_RETRY_AFTER') or 300)
+    LIVE_KEEPALIVE_INTERVAL = float(os.environ.get('LIVE_KEEPALIVE_INTERVAL') or 15)
+    LIVE_STREAM_LIFETIME = float(os.environ.get('LIVE_STREAM_LIFETIME') or 25)
+    LIVE_RETRY_INTERVAL = float(os.environ.get('LIVE_RETRY_INTERVAL') or 5)
+    METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL') or 15)
+    # bearer token of the prometheus scraper, without it only admins see /metrics
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    ACTIVITY_FLUSH_INTERVAL = float(os.environ.get('ACTIVITY_FLUSH_INTERVAL') or 60)
+    ACTIVITY_FLUSH_ON_SHUTDOWN = os.environ.get('ACTIVITY_NO_SHUTDOWN_FLUSH') is None
+    REDIS_HOST = os.environ.get('REDIS_HOST') or 'localhost'
+    REDIS_PORT = int(os.environ.get('REDIS_PORT') or 6379)
+    REDIS_DB = int(os.environ.get('REDIS_DB') or 0)
+    REDIS_PASSWORD = os.environ.get('REDIS_PASSWORD')
+    REDIS_UNIX_SOCKET_PATH = os.environ.get('REDIS_UNIX_SOCKET_PATH')
+    REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS') or 50)
+    REDIS_POOL_TIMEOUT = float(os.environ.get('REDIS_POOL_TIMEOUT') or 20)
+    REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT') or 5)
+    REDIS_SOCKET_CONNECT_TIMEOUT = float(os.environ.get('REDIS_SOCKET_CONNECT_TIMEOUT') or 5)
+    REDIS_HEALTH_CHECK_INTERVAL = int(os.environ.get('REDIS_HEALTH_CHECK_INTERVAL') or 0)
+    SCRAPER_CONCURRENCY = int(os.environ.get('SCRAPER_CONCURRENCY') or 4)
+    SCRAPER_MAX_PAGES_PER_BROWSER = int(os.environ.get('SCRAPER_MAX_PAGES_PER_BROWSER') or 50)
+    SCRAPER_PAGE_TIMEOUT = float(os.environ.get('SCRAPER_PAGE_TIMEOUT') or 15)
+    SCRAPER_HTTP_TIMEOUT = float(os.environ.get('SCRAPER_HTTP_TIMEOUT') or 10)
+    ASYNC_FETCH_CONCURRENCY = int(os.environ.get('ASYNC_FETCH_CONCURRENCY') or 16)
+    ASYNC_DIFF_CONCURRENCY = int(os.environ.get('ASYNC_DIFF_CONCURRENCY') or 4)
+    ASYNC_QUEUE_SIZE = int(os.environ.get('ASYNC_QUEUE_SIZE') or 100)
+    LEASE_TTL = int(os.environ.get('LEASE_TTL') or 120)
+    LEASE_BATCH_SIZE = int(os.environ.get('LEASE_BATCH_SIZE') or 50)
+    LEASE_RETRY_INTERVAL = float(os.environ.get('LEASE_RETRY_INTERVAL') or 5)
+    THROTTLE_RATE = float(os.environ.get('THROTTLE_RATE') or 5)
+    THROTTLE_BURST = int(os.environ.get('THROTTLE_BURST') or 10)
+    THROTTLE_CONCURRENCY = int(os.environ.get('THROTTLE_CONCURRENCY') or 8)
+    THROTTLE_RETRIES = int(os.environ.get('THROTTLE_RETRIES') or 3)
+    THROTTLE_BACKOFF = float(os.environ.get('THROTTLE_BACKOFF') or 1)
+    CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD') or 10)
+    CIRCUIT_RESET_TIMEOUT = int(os.environ.get('CIRCUIT_RESET_TIMEOUT') or 60)
+    IFVOD_POOL_SIZE = int(os.environ.get('IFVOD_POOL_SIZE') or SCRAPER_CONCURRENCY)
+    IFVOD_RATE = float(os.environ.get('IFVOD_RATE') or THROTTLE_RATE)
+    IFVOD_BURST = int(os.environ.get('IFVOD_BURST') or THROTTLE_BURST)
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE') or 1024)
+    USER_CACHE_LOCAL_TTL = int(os.environ.get('USER_CACHE_LOCAL_TTL') or 30)
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL') or 86400)
+    NAME_CACHE_SIZE = int(os.environ.get('NAME_CACHE_SIZE') or 1024)
+    NAME_CACHE_LOCAL_TTL = int(os.environ.get('NAME_CACHE_LOCAL_TTL') or 300)
+    NAME_SOFT_TTL = int(os.environ.get('NAME_SOFT_TTL') or 86400)
+    NAME_NEGATIVE_TTL = int(os.environ.get('NAME_NEGATIVE_TTL') or 300)
+    NAME_LOCK_TIMEOUT = int(os.environ.get('NAME_LOCK_TIMEOUT') or 15)
+    NAME_LOAD_WORKERS = int(os.environ.get('NAME_LOAD_WORKERS') or 4)
+    SCHEDULER_MIN_INTERVAL = int(os.environ.get('SCHEDULER_MIN_INTERVAL') or 900)
+    SCHEDULER_DEFAULT_INTERVAL = int(os.environ.get('SCHEDULER_DEFAULT_INTERVAL') or 3600)
+    SCHEDULER_MAX_INTERVAL = int(os.environ.get('SCHEDULER_MAX_INTERVAL') or 604800)
\ No newline at end of file
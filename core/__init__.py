@@ -7,7 +7,9 @@ from flask_migrate import Migrate
 from flask_login import LoginManager
 from flask_mail import Mail
 from flask_bootstrap import Bootstrap
+import redis
 from config import Config
+from metrics import TimedRedis
 
 app = Flask(__name__)
 app.config.from_object(Config)
@@ -18,6 +20,24 @@ login.login_view = 'login'
 mail = Mail(app)
 bootstrap = Bootstrap(app)
 
+# one connection pool per process, shared by web requests and the cron job
+redis_options = dict(
+    db=app.config['REDIS_DB'],
+    password=app.config['REDIS_PASSWORD'],
+    socket_timeout=app.config['REDIS_SOCKET_TIMEOUT'],
+    health_check_interval=app.config['REDIS_HEALTH_CHECK_INTERVAL'],
+    max_connections=app.config['REDIS_MAX_CONNECTIONS'],
+    timeout=app.config['REDIS_POOL_TIMEOUT'])
+if app.config['REDIS_UNIX_SOCKET_PATH']:
+    redis_pool = redis.BlockingConnectionPool(
+        connection_class=redis.UnixDomainSocketConnection,
+        path=app.config['REDIS_UNIX_SOCKET_PATH'], **redis_options)
+else:
+    redis_pool = redis.BlockingConnectionPool(
+        host=app.config['REDIS_HOST'], port=app.config['REDIS_PORT'],
+        socket_connect_timeout=app.config['REDIS_SOCKET_CONNECT_TIMEOUT'], **redis_options)
+redis_client = TimedRedis(connection_pool=redis_pool)
+
 if not app.debug:
     if app.config['MAIL_SERVER']:
         auth = None
@@ -46,4 +66,4 @@ if not app.debug:
     app.logger.setLevel(logging.INFO)
     app.logger.info('DramaChaser startup')
 
-from core import routes, models, errors
+from core import routes, models, errors, cli
@@ -0,0 +1,64 @@
+import atexit
+from datetime import datetime
+import logging
+import os
+from threading import Lock, Thread
+import time
+from sqlalchemy import bindparam
+from core import app, db
+from core.models import User
+
+
+# buffer when users were last seen and write them to the user table in one
+# batched UPDATE every flush_interval seconds instead of committing per request
+class ActivityTracker:
+    def __init__(self, flush_interval):
+        self.__flush_interval = flush_interval
+        self.__lock = Lock()
+        # key => user id, value => latest utc datetime the user was seen
+        self.__last_seen = {}
+        self.__pid = None
+
+    def touch(self, user_id):
+        with self.__lock:
+            self.__last_seen[user_id] = datetime.utcnow()
+            # threads don't survive a fork, every worker process starts its own flusher
+            if self.__pid != os.getpid():
+                self.__pid = os.getpid()
+                Thread(target=self.__run, daemon=True).start()
+
+    def __run(self):
+        while True:
+            time.sleep(self.__flush_interval)
+            self.flush()
+
+    # returns number of users written
+    def flush(self):
+        with self.__lock:
+            last_seen, self.__last_seen = self.__last_seen, {}
+        if len(last_seen) == 0:
+            return 0
+        statement = User.__table__.update().where(User.id == bindparam('user_id')).values(
+            last_seen=bindparam('seen_time'))
+        with app.app_context():
+            try:
+                db.session.execute(statement, [
+                    {'user_id': user_id, 'seen_time': seen_time} for user_id, seen_time in last_seen.items()
+                ])
+                db.session.commit()
+            except Exception as ex:
+                db.session.rollback()
+                logging.error('Failed to save last seen time of {} users: {}'.format(len(last_seen), ex))
+                # keep them for the next flush unless the user was seen again meanwhile
+                with self.__lock:
+                    for user_id, seen_time in last_seen.items():
+                        self.__last_seen.setdefault(user_id, seen_time)
+                return 0
+            finally:
+                db.session.remove()
+        return len(last_seen)
+
+
+tracker = ActivityTracker(app.config['ACTIVITY_FLUSH_INTERVAL'])
+if app.config['ACTIVITY_FLUSH_ON_SHUTDOWN']:
+    atexit.register(tracker.flush)
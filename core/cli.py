@@ -0,0 +1,51 @@
+import os
+import socket
+import click
+from core import app
+
+
+@app.cli.group()
+def redis():
+    """Redis data maintenance commands."""
+    pass
+
+
+@redis.command()
+def migrate():
+    """Convert pickled drama objects to drama hashes."""
+    import chaser
+    migrated = chaser.DramaChaser().migrate_pickled_dramas()
+    click.echo('Migrated {} dramas'.format(migrated))
+
+
+@redis.command('rebuild-followers')
+def rebuild_followers():
+    """Rebuild the drama to followers index from user drama sets."""
+    from core.dramas import DramaLibrary
+    indexed = DramaLibrary().rebuild_follower_index()
+    click.echo('Indexed followers of {} dramas'.format(indexed))
+
+
+@app.cli.group()
+def outbox():
+    """Notification outbox commands."""
+    pass
+
+
+@outbox.command()
+@click.option('--once', is_flag=True, help='Exit when the outbox is empty.')
+def work(once):
+    """Deliver queued emails."""
+    from core import redis_client
+    from core.outbox import Outbox
+    from metrics import metrics
+    consumer = '{}-{}'.format(socket.gethostname(), os.getpid())
+    mailbox = Outbox(
+        redis_client,
+        max_deliveries=app.config['OUTBOX_MAX_DELIVERIES'],
+        retry_after=app.config['OUTBOX_RETRY_AFTER'])
+    while True:
+        processed = mailbox.deliver(consumer, block=None if once else 2000)
+        metrics.flush(redis_client)
+        if once and processed == 0:
+            break
@@ -0,0 +1,362 @@
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+import json
+import logging
+import os
+from threading import Lock
+import time
+import redis
+from core import app, redis_client
+from metrics import metrics
+from scraper.cache import CacheStats, LRUCache
+from scraper.providers import IFVODProvider
+from scraper.scheduler import PollScheduler
+# the web facing read side of dramas, the scraping engine lives in chaser.py and
+# is only loaded by the cron job and the CLI, requests is imported where a drama
+# name has to be fetched
+
+class VOD(Enum):
+    IFVOD = 1
+
+# key => VOD, value => provider class
+# settings of a provider are read from {VOD name}_POOL_SIZE, _RATE and _BURST
+PROVIDERS = {VOD.IFVOD: IFVODProvider}
+
+def new_provider(vod):
+    return PROVIDERS[vod](
+        pool_size=app.config['{}_POOL_SIZE'.format(vod.name)],
+        rate=app.config['{}_RATE'.format(vod.name)],
+        burst=app.config['{}_BURST'.format(vod.name)])
+
+def new_throttle(provider):
+    from scraper.throttle import Throttle
+    return Throttle(
+        redis_client, provider.domain,
+        rate=provider.rate,
+        burst=provider.burst,
+        concurrency=app.config['THROTTLE_CONCURRENCY'],
+        retries=app.config['THROTTLE_RETRIES'],
+        backoff=app.config['THROTTLE_BACKOFF'],
+        failure_threshold=app.config['CIRCUIT_FAILURE_THRESHOLD'],
+        reset_timeout=app.config['CIRCUIT_RESET_TIMEOUT'])
+
+def new_scheduler():
+    return PollScheduler(
+        redis_client,
+        min_interval=app.config['SCHEDULER_MIN_INTERVAL'],
+        default_interval=app.config['SCHEDULER_DEFAULT_INTERVAL'],
+        max_interval=app.config['SCHEDULER_MAX_INTERVAL'])
+
+class DRAMAOP(Enum):
+    CHASE = 1
+    ABANDON = 2
+
+# drama hash layout version, bump when fields change
+DRAMA_VERSION = 1
+
+# hot drama names of this process, in front of redis
+name_cache = LRUCache(maxsize=app.config['NAME_CACHE_SIZE'], ttl=app.config['NAME_CACHE_LOCAL_TTL'])
+name_cache_stats = CacheStats()
+
+def count_name_lookup(result):
+    name_cache_stats.incr(result)
+    metrics.incr('name_lookups_total', result=result)
+
+# loads drama names off the request thread with a bounded number of threads per
+# process, a drama which is already queued is not queued again
+class NameLoader:
+    def __init__(self, workers):
+        self.__workers = workers
+        self.__lock = Lock()
+        self.__queued = set()
+        self.__executor = None
+        self.__pid = None
+
+    # load(drama_id) runs in background unless drama_id is queued already
+    def submit(self, drama_id, load):
+        with self.__lock:
+            # threads don't survive a fork, every worker process starts its own pool
+            if self.__pid != os.getpid():
+                self.__pid = os.getpid()
+                self.__executor = ThreadPoolExecutor(max_workers=self.__workers)
+                self.__queued = set()
+            if drama_id in self.__queued:
+                return
+            self.__queued.add(drama_id)
+            self.__executor.submit(self.__run, drama_id, load)
+
+    def __run(self, drama_id, load):
+        try:
+            load(drama_id)
+        except Exception as ex:
+            logging.error('Failed to load name of drama {}: {}'.format(drama_id, ex))
+        finally:
+            with self.__lock:
+                self.__queued.discard(drama_id)
+
+name_loader = NameLoader(app.config['NAME_LOAD_WORKERS'])
+
+# http statuses of a drama page which prove the drama id invalid
+NOT_FOUND_STATUSES = (404, 410)
+
+class InvalidDramaError(Exception):
+    pass
+
+# show lists are stored as json arrays of [play_id, title], scraped ones
+# hold scraper.parser.Episode records until then
+def encode_show_list(show_list):
+    return json.dumps([show[:2] for show in show_list], ensure_ascii=False, separators=(',', ':'))
+
+def decode_show_list(value):
+    return None if value is None else [tuple(show) for show in json.loads(value)]
+
+def transform_showlist_to_urls(provider, show_list):
+    if show_list is None:
+        return None
+    return [(provider.get_play_url(show[0]), show[1]) for show in show_list]
+
+# who follows which drama, drama names and what the index page shows
+class DramaLibrary:
+    def __init__(self):
+        self.__redis_client = redis_client
+        self.__scheduler = new_scheduler()
+        # names and links of every provider are served
+        self.__providers = {vod: new_provider(vod) for vod in PROVIDERS}
+
+    # the provider with the longest matching prefix owns a drama
+    def find_vod(self, drama_id):
+        owners = [vod for vod, provider in self.__providers.items() if provider.owns(drama_id)]
+        return max(owners, key=lambda vod: len(self.__providers[vod].prefix))
+
+    def __get_provider_of(self, drama_id):
+        return self.__providers[self.find_vod(drama_id)]
+
+    @staticmethod
+    def __get_all_users_key():
+        return 'users'
+
+    @staticmethod
+    def __get_followers_key(drama_id):
+        return "{}:followers".format(drama_id)
+
+    # sorted set {drama_id: number of followers}
+    @staticmethod
+    def __get_follower_counts_key():
+        return 'follower_counts'
+
+    # exists for a short while after a drama id turned out to be invalid
+    @staticmethod
+    def __get_invalid_key(drama_id):
+        return "{}:invalid".format(drama_id)
+
+    # held by the process fetching the drama name
+    @staticmethod
+    def __get_name_lock_key(drama_id):
+        return "{}:name_lock".format(drama_id)
+
+    def __get_all_users(self):
+        return self.__redis_client.smembers(DramaLibrary.__get_all_users_key())
+
+    def __get_drama_ids(self, user_id):
+        return self.__redis_client.smembers(user_id)
+
+    # dramas followed by anyone
+    def get_followed_drama_ids(self):
+        drama_ids = self.__redis_client.zrangebyscore(DramaLibrary.__get_follower_counts_key(), 1, '+inf')
+        return [drama_id.decode('utf-8') for drama_id in drama_ids]
+
+    # key => user_id, value => set of drama ids the user follows out of drama_ids
+    def get_followers_of_dramas(self, drama_ids):
+        pipe = self.__redis_client.pipeline(transaction=False)
+        for drama_id in drama_ids:
+            pipe.smembers(DramaLibrary.__get_followers_key(drama_id))
+        user_drama_ids = {}
+        for drama_id, followers in zip(drama_ids, pipe.execute()):
+            for user_id in followers:
+                user_drama_ids.setdefault(user_id.decode('utf-8'), set()).add(drama_id)
+        return user_drama_ids
+
+    # fetch drama sets of all users in one round trip
+    # key => user_id, value => set of drama ids, both as bytes
+    def get_drama_ids_of_all_users(self):
+        user_ids = list(self.__get_all_users())
+        pipe = self.__redis_client.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.smembers(user_id)
+        return dict(zip(user_ids, pipe.execute()))
+
+    # load drama name from local cache, then DB, parse webpage if both missed
+    # names older than NAME_SOFT_TTL are served and refreshed in background
+    # raises InvalidDramaError if the vod doesn't know the drama
+    def load_drama_name(self, drama_id):
+        drama_name = name_cache.get(drama_id)
+        if drama_name is not None:
+            count_name_lookup('local_hits')
+            return drama_name
+        drama_name, updated_time = self.__redis_client.hmget(drama_id, 'drama_name', 'name_updated_time')
+        if drama_name is not None:
+            count_name_lookup('redis_hits')
+            drama_name = drama_name.decode('utf-8')
+            name_cache.set(drama_id, drama_name)
+            if updated_time is None or time.time() - float(updated_time) > app.config['NAME_SOFT_TTL']:
+                name_loader.submit(drama_id, self.__refresh_drama_name)
+            return drama_name
+        if self.__redis_client.exists(DramaLibrary.__get_invalid_key(drama_id)):
+            count_name_lookup('negative_hits')
+            raise InvalidDramaError('Invalid drama id {}'.format(drama_id))
+        count_name_lookup('misses')
+        return self.__fetch_drama_name(drama_id, wait=True)
+
+    def __refresh_drama_name(self, drama_id):
+        self.__fetch_drama_name(drama_id, wait=False)
+
+    # only one process fetches a name at a time, with wait the others poll for
+    # its result, without wait they give up and return None
+    def __fetch_drama_name(self, drama_id, wait):
+        import requests
+        from scraper import fetch
+        lock_key = DramaLibrary.__get_name_lock_key(drama_id)
+        lock_timeout = app.config['NAME_LOCK_TIMEOUT']
+        deadline = time.time() + lock_timeout
+        locked = False
+        while True:
+            locked = self.__redis_client.set(lock_key, 1, nx=True, ex=lock_timeout)
+            if locked:
+                break
+            if not wait:
+                return None
+            time.sleep(0.1)
+            drama_name = self.__redis_client.hget(drama_id, 'drama_name')
+            if drama_name is not None:
+                return drama_name.decode('utf-8')
+            if self.__redis_client.exists(DramaLibrary.__get_invalid_key(drama_id)):
+                raise InvalidDramaError('Invalid drama id {}'.format(drama_id))
+            if time.time() > deadline:
+                break
+        try:
+            provider = self.__get_provider_of(drama_id)
+            try:
+                page = fetch.get_page(
+                    provider.get_metadata_url(drama_id), app.config['SCRAPER_HTTP_TIMEOUT'], new_throttle(provider))
+                drama_name = provider.parse_drama_name(page)
+            except requests.HTTPError as ex:
+                # only a page the site says is gone proves the id invalid, rate
+                # limits and server errors must not be cached
+                if ex.response is None or ex.response.status_code not in NOT_FOUND_STATUSES:
+                    raise
+                drama_name = None
+            if drama_name is None:
+                self.__redis_client.set(DramaLibrary.__get_invalid_key(drama_id), 1, ex=app.config['NAME_NEGATIVE_TTL'])
+                raise InvalidDramaError('Invalid drama id {}'.format(drama_id))
+            self.__redis_client.hset(drama_id, mapping={
+                'drama_name': drama_name,
+                'name_updated_time': time.time(),
+                'version': DRAMA_VERSION
+            })
+            name_cache.set(drama_id, drama_name)
+            return drama_name
+        finally:
+            if locked:
+                self.__redis_client.delete(lock_key)
+
+    @staticmethod
+    def get_name_cache_stats():
+        return name_cache_stats.as_dict()
+
+    # raises InvalidDramaError if no provider recognizes the link
+    def __parse_drama_link(self, drama_link):
+        for provider in self.__providers.values():
+            drama_id = provider.parse_drama_id(drama_link)
+            if drama_id is not None:
+                return drama_id
+        raise InvalidDramaError('Unknown drama link {}'.format(drama_link))
+
+    def __update_drama(self, user_id, op, drama_id):
+        pipe = self.__redis_client.pipeline()
+        followers_key = DramaLibrary.__get_followers_key(drama_id)
+        while True:
+            try:
+                # a chase by someone else changes the followers and retries
+                # the abandon of the last follower
+                pipe.watch(user_id, followers_key)
+                following = pipe.sismember(user_id, drama_id)
+                last_follower = op == DRAMAOP.ABANDON and following and pipe.scard(followers_key) <= 1
+                pipe.multi()
+                if op == DRAMAOP.CHASE:
+                    pipe.sadd(user_id, drama_id) # user to drama mapping
+                    pipe.sadd(DramaLibrary.__get_all_users_key(), user_id) # all users mapping
+                    pipe.sadd(followers_key, user_id) # drama to user mapping
+                    if not following:
+                        pipe.zincrby(DramaLibrary.__get_follower_counts_key(), 1, drama_id)
+                else:
+                    pipe.srem(user_id, drama_id)
+                    pipe.srem(followers_key, user_id)
+                    if following:
+                        pipe.zincrby(DramaLibrary.__get_follower_counts_key(), -1, drama_id)
+                        pipe.zremrangebyscore(DramaLibrary.__get_follower_counts_key(), '-inf', 0)
+                    if last_follower:
+                        self.__scheduler.remove(drama_id, pipe)
+                pipe.execute()
+                break
+            except redis.WatchError:
+                continue
+            finally:
+                pipe.reset()
+
+    # chase a drama from UI
+    def chase(self, user_id, drama_id, drama_name):
+        self.__update_drama(user_id, DRAMAOP.CHASE, drama_id)
+        self.__scheduler.add(drama_id)
+
+    # abandon a drama from UI
+    def abandon(self, user_id, drama_link):
+        drama_id = self.__parse_drama_link(drama_link)
+        self.__update_drama(user_id, DRAMAOP.ABANDON, drama_id)
+
+    # least followed dramas first, list of (drama_id, follower count)
+    def get_drama_ranking(self, count=10):
+        ranking = self.__redis_client.zrange(DramaLibrary.__get_follower_counts_key(), 0, count - 1, withscores=True)
+        return [(drama_id.decode('utf-8'), int(score)) for drama_id, score in ranking]
+
+    # rebuild drama to followers mapping and follower counts from user to drama mapping
+    def rebuild_follower_index(self):
+        user_drama_ids = self.get_drama_ids_of_all_users()
+        old_keys = list(self.__redis_client.scan_iter(match=DramaLibrary.__get_followers_key('*')))
+        followers = {}
+        for user_id, drama_ids in user_drama_ids.items():
+            for drama_id in drama_ids:
+                followers.setdefault(drama_id.decode('utf-8'), set()).add(user_id.decode('utf-8'))
+        pipe = self.__redis_client.pipeline()
+        pipe.delete(DramaLibrary.__get_follower_counts_key(), *old_keys)
+        for drama_id, user_ids in followers.items():
+            pipe.sadd(DramaLibrary.__get_followers_key(drama_id), *user_ids)
+            pipe.zadd(DramaLibrary.__get_follower_counts_key(), {drama_id: len(user_ids)})
+        pipe.execute()
+        return len(followers)
+
+    def get_user_drama_ids(self, user_id):
+        return [drama_id.decode('utf-8') for drama_id in self.__get_drama_ids(user_id)]
+
+    # get all drama metadata for a user in one round trip
+    # dramas without a name yet show their id until the name is loaded in background
+    def get_drama_metadata(self, user_id):
+        drama_ids = list(self.__get_drama_ids(user_id))
+        pipe = self.__redis_client.pipeline(transaction=False)
+        for drama_id in drama_ids:
+            pipe.hmget(drama_id, 'drama_name', 'current_show_list')
+        drama_metadata = {}
+        missing_drama_ids = []
+        for drama_id, (drama_name, current_show_list) in zip(drama_ids, pipe.execute()):
+            drama_id = drama_id.decode('utf-8')
+            provider = self.__get_provider_of(drama_id)
+            payload = {}
+            payload['show_list'] = transform_showlist_to_urls(provider, decode_show_list(current_show_list))
+            if drama_name is None:
+                missing_drama_ids.append(drama_id)
+                payload['drama_name'] = drama_id
+            else:
+                payload['drama_name'] = drama_name.decode('utf-8')
+            drama_metadata[provider.get_metadata_url(drama_id)] = payload
+        for drama_id in missing_drama_ids:
+            name_loader.submit(drama_id, self.load_drama_name)
+        return drama_metadata
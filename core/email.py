@@ -1,7 +1,28 @@
-from threading import Thread
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import smtplib
+from threading import Event, Thread, Lock
+import time
 from flask import render_template
 from flask_mail import Message
 from core import app, mail
+from metrics import metrics
+
+
+# spread calls evenly so that at most rate calls happen per second
+class RateLimiter:
+    def __init__(self, rate):
+        self.__interval = 1.0 / rate if rate else 0
+        self.__next_time = 0
+        self.__lock = Lock()
+
+    def wait(self):
+        with self.__lock:
+            now = time.time()
+            delay = self.__next_time - now
+            self.__next_time = max(now, self.__next_time) + self.__interval
+        if delay > 0:
+            time.sleep(delay)
 
 
 def send_async_email(app, msg):
@@ -9,13 +30,86 @@ def send_async_email(app, msg):
         mail.send(msg)
 
 
-def send_email(subject, sender, recipients, text_body, html_body):
+def build_email(subject, sender, recipients, text_body, html_body):
     msg = Message(subject, sender=sender, recipients=recipients)
     msg.body = text_body
     msg.html = html_body
+    return msg
+
+
+def send_email(subject, sender, recipients, text_body, html_body):
+    msg = build_email(subject, sender, recipients, text_body, html_body)
     Thread(target=send_async_email, args=(app, msg)).start()
 
 
+# errors about one message, the connection goes on with the next one
+MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+
+# send messages over one SMTP connection, reconnect and retry on failure
+# a server which fails retries times in a row is taken as down, the rest of the
+# batch fails at once and so do the batches of other workers sharing give_up
+# returns (number of sent messages, failed messages)
+def send_email_batch(app, messages, retries, rate_limiter, give_up=None):
+    give_up = give_up or Event()
+    sent = 0
+    failed = []
+    index = 0
+    attempts = 0
+    with app.app_context():
+        while index < len(messages) and not give_up.is_set():
+            try:
+                with mail.connect() as connection:
+                    while index < len(messages) and not give_up.is_set():
+                        rate_limiter.wait()
+                        try:
+                            with metrics.timer('smtp_send_seconds'):
+                                connection.send(messages[index])
+                            metrics.incr('emails_sent_total')
+                            sent += 1
+                        except MESSAGE_ERRORS as ex:
+                            logging.error('Failed to send email to {}: {}'.format(messages[index].recipients, ex))
+                            failed.append(messages[index])
+                            metrics.incr('emails_failed_total')
+                        index += 1
+                        attempts = 0
+            except Exception as ex:
+                if index >= len(messages):
+                    break
+                attempts += 1
+                if attempts > retries:
+                    logging.error('Giving up on {} emails after {} failed attempts: {}'.format(
+                        len(messages) - index, attempts, ex))
+                    give_up.set()
+                else:
+                    give_up.wait(2 ** attempts)
+    # left over because the server is down, the outbox retries them later
+    if index < len(messages):
+        failed.extend(messages[index:])
+        metrics.incr('emails_failed_total', len(messages) - index)
+    return sent, failed
+
+
+# send many messages with a bounded number of SMTP connections
+# returns a summary dict {sent: <count>, failed: <messages>}
+def send_bulk_email(messages):
+    workers = max(1, min(app.config['MAIL_SENDER_WORKERS'], len(messages)))
+    rate_limiter = RateLimiter(app.config['MAIL_MAX_PER_SECOND'])
+    give_up = Event()
+    batches = [messages[i::workers] for i in range(workers)]
+    summary = {'sent': 0, 'failed': []}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(send_email_batch, app, batch, app.config['MAIL_SEND_RETRIES'], rate_limiter, give_up)
+            for batch in batches
+        ]
+        for future in futures:
+            sent, failed = future.result()
+            summary['sent'] += sent
+            summary['failed'].extend(failed)
+    return summary
+
+
 def send_password_reset_email(user):
     token = user.get_reset_password_token()
     send_email('[DramaChaser] Reset Your Password',
@@ -24,4 +118,4 @@ def send_password_reset_email(user):
                text_body=render_template('email/reset_password.txt',
                                          user=user, token=token),
                html_body=render_template('email/reset_password.html',
-                                         user=user, token=token))
\ No newline at end of file
+                                         user=user, token=token))
@@ -0,0 +1,97 @@
+import json
+import logging
+import os
+import queue
+from threading import Lock, Thread
+import time
+from core import app, redis_client
+
+
+# fan out drama updates published by cron runs to the event streams of the
+# web app, every process holds one subscription however many clients it serves
+# channel => drama_updates, json {drama_id, drama, show_list}
+class UpdateBroker:
+    CHANNEL = 'drama_updates'
+
+    def __init__(self, redis_client):
+        self.__redis_client = redis_client
+        self.__lock = Lock()
+        # key => drama_id, value => set of queues of the streams showing it
+        self.__listeners = {}
+        self.__pid = None
+
+    # publish the new show list of a drama, show_list is a list of (play_url, title)
+    def publish(self, drama_id, drama_url, show_list, pipe=None):
+        message = json.dumps({'drama_id': drama_id, 'drama': drama_url, 'show_list': show_list})
+        (pipe or self.__redis_client).publish(UpdateBroker.CHANNEL, message)
+
+    # returns a queue receiving the update messages of drama_ids
+    def listen(self, drama_ids):
+        updates = queue.Queue(maxsize=100)
+        with self.__lock:
+            # threads don't survive a fork, every worker process starts its own subscriber
+            if self.__pid != os.getpid():
+                self.__pid = os.getpid()
+                self.__listeners = {}
+                Thread(target=self.__run, daemon=True).start()
+            for drama_id in drama_ids:
+                self.__listeners.setdefault(drama_id, set()).add(updates)
+        return updates
+
+    def stop_listening(self, updates, drama_ids):
+        with self.__lock:
+            for drama_id in drama_ids:
+                listeners = self.__listeners.get(drama_id, set())
+                listeners.discard(updates)
+                if len(listeners) == 0:
+                    self.__listeners.pop(drama_id, None)
+
+    def __run(self):
+        while True:
+            pubsub = self.__redis_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(UpdateBroker.CHANNEL)
+                for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        self.__dispatch(message['data'].decode('utf-8'))
+            except Exception as ex:
+                logging.error('Lost subscription to {}: {}'.format(UpdateBroker.CHANNEL, ex))
+                time.sleep(1)
+            finally:
+                pubsub.close()
+
+    def __dispatch(self, message):
+        drama_id = json.loads(message)['drama_id']
+        with self.__lock:
+            listeners = list(self.__listeners.get(drama_id, ()))
+        for updates in listeners:
+            try:
+                updates.put_nowait(message)
+            except queue.Full:
+                # a stalled client misses updates rather than blocking everyone
+                pass
+
+
+# server-sent events of the given dramas, comments keep idle connections alive
+# the stream ends after LIVE_STREAM_LIFETIME seconds, EventSource reconnects by
+# itself after LIVE_RETRY_INTERVAL, a stream holds its worker the whole time so
+# the app is served by async workers, see gunicorn.conf.py
+def stream_updates(drama_ids):
+    updates = broker.listen(drama_ids)
+    deadline = time.time() + app.config['LIVE_STREAM_LIFETIME']
+    try:
+        yield 'retry: {}\n\n'.format(int(app.config['LIVE_RETRY_INTERVAL'] * 1000))
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return
+            try:
+                yield 'data: {}\n\n'.format(
+                    updates.get(timeout=min(app.config['LIVE_KEEPALIVE_INTERVAL'], remaining)))
+            except queue.Empty:
+                yield ': keepalive\n\n'
+    finally:
+        broker.stop_listening(updates, drama_ids)
+
+
+broker = UpdateBroker(redis_client)
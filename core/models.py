@@ -4,7 +4,9 @@ from time import time
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
-from core import app, db, login
+from core import app, db, login, redis_client
+from metrics import metrics
+from scraper.cache import LRUCache
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -42,6 +44,60 @@ class User(UserMixin, db.Model):
             return
         return User.query.get(id)
 
+# users of login sessions, in front of redis, in front of the user table
+# cached users are detached copies holding only the fields below, load the
+# user from the table to change it and invalidate it afterwards
+# key => user:{id}, hash {id, username, email, about_me}
+class UserCache:
+    FIELDS = ('id', 'username', 'email', 'about_me')
+
+    def __init__(self, redis_client, maxsize, local_ttl, ttl):
+        self.__redis_client = redis_client
+        self.__local = LRUCache(maxsize=maxsize, ttl=local_ttl)
+        self.__ttl = ttl
+
+    @staticmethod
+    def __get_key(user_id):
+        return 'user:{}'.format(user_id)
+
+    # returns None if there is no such user
+    def get(self, user_id):
+        user = self.__local.get(user_id)
+        if user is not None:
+            metrics.incr('user_lookups_total', result='local_hits')
+            return user
+        key = UserCache.__get_key(user_id)
+        fields = {name.decode('utf-8'): value.decode('utf-8') for name, value in self.__redis_client.hgetall(key).items()}
+        if len(fields) != 0:
+            metrics.incr('user_lookups_total', result='redis_hits')
+            fields['id'] = int(fields['id'])
+        else:
+            metrics.incr('user_lookups_total', result='misses')
+            user = User.query.get(user_id)
+            if user is None:
+                return None
+            # missing fields read back as None
+            fields = {name: getattr(user, name) for name in UserCache.FIELDS if getattr(user, name) is not None}
+            pipe = self.__redis_client.pipeline()
+            pipe.hset(key, mapping=fields)
+            pipe.expire(key, self.__ttl)
+            pipe.execute()
+        user = User(**fields)
+        self.__local.set(user_id, user)
+        return user
+
+    # other processes may serve their local copy for up to local_ttl seconds
+    def invalidate(self, user_id):
+        self.__local.delete(user_id)
+        self.__redis_client.delete(UserCache.__get_key(user_id))
+
+
+user_cache = UserCache(
+    redis_client,
+    maxsize=app.config['USER_CACHE_SIZE'],
+    local_ttl=app.config['USER_CACHE_LOCAL_TTL'],
+    ttl=app.config['USER_CACHE_TTL'])
+
 @login.user_loader
 def load_user(id):
-    return User.query.get(int(id))
\ No newline at end of file
+    return user_cache.get(int(id))
\ No newline at end of file
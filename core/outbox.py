@@ -0,0 +1,97 @@
+import json
+import logging
+import redis
+from core.email import build_email, send_bulk_email
+
+
+# durable queue of emails kept in a redis stream
+# the cron job enqueues, `flask outbox work` processes on any node deliver
+# key => outbox, stream of {subject, sender, recipients, text_body, html_body}
+# key => outbox:dead, stream of emails which failed max_deliveries times
+class Outbox:
+    def __init__(self, redis_client, max_deliveries=5, retry_after=300):
+        self.__redis_client = redis_client
+        self.__max_deliveries = max_deliveries
+        self.__retry_after_ms = int(retry_after * 1000)
+
+    @staticmethod
+    def __get_stream_key():
+        return 'outbox'
+
+    @staticmethod
+    def __get_dead_letter_key():
+        return 'outbox:dead'
+
+    @staticmethod
+    def __get_group_name():
+        return 'mailers'
+
+    # pass a pipeline to enqueue atomically with other writes
+    def enqueue(self, subject, sender, recipients, text_body, html_body, pipe=None):
+        client = self.__redis_client if pipe is None else pipe
+        client.xadd(Outbox.__get_stream_key(), {
+            'subject': subject,
+            'sender': sender,
+            'recipients': json.dumps(recipients),
+            'text_body': text_body,
+            'html_body': html_body
+        })
+
+    def __ensure_group(self):
+        try:
+            self.__redis_client.xgroup_create(
+                Outbox.__get_stream_key(), Outbox.__get_group_name(), id='0', mkstream=True)
+        except redis.ResponseError as ex:
+            if 'BUSYGROUP' not in str(ex):
+                raise
+
+    # take over emails a consumer failed to acknowledge in time,
+    # give up on those delivered too many times
+    def __claim_stale(self, consumer, count):
+        pending = self.__redis_client.xpending_range(
+            Outbox.__get_stream_key(), Outbox.__get_group_name(), '-', '+', count)
+        stale = [entry for entry in pending if entry['time_since_delivered'] >= self.__retry_after_ms]
+        dead_ids = [entry['message_id'] for entry in stale if entry['times_delivered'] >= self.__max_deliveries]
+        retry_ids = [entry['message_id'] for entry in stale if entry['times_delivered'] < self.__max_deliveries]
+        for message_id in dead_ids:
+            for _, fields in self.__redis_client.xrange(Outbox.__get_stream_key(), message_id, message_id):
+                logging.error('Giving up on email {} to {}'.format(message_id, fields[b'recipients']))
+                self.__redis_client.xadd(Outbox.__get_dead_letter_key(), fields)
+            self.__ack(dead_ids)
+        if len(retry_ids) == 0:
+            return []
+        return self.__redis_client.xclaim(
+            Outbox.__get_stream_key(), Outbox.__get_group_name(), consumer, self.__retry_after_ms, retry_ids)
+
+    def __ack(self, message_ids):
+        if len(message_ids) == 0:
+            return
+        pipe = self.__redis_client.pipeline()
+        pipe.xack(Outbox.__get_stream_key(), Outbox.__get_group_name(), *message_ids)
+        pipe.xdel(Outbox.__get_stream_key(), *message_ids)
+        pipe.execute()
+
+    @staticmethod
+    def __decode(fields):
+        fields = {key.decode('utf-8'): value.decode('utf-8') for key, value in fields.items()}
+        fields['recipients'] = json.loads(fields['recipients'])
+        return fields
+
+    # deliver up to count emails, block milliseconds waiting for new ones
+    # failed emails stay pending and are retried after retry_after seconds
+    # returns the number of emails processed
+    def deliver(self, consumer, count=100, block=None):
+        self.__ensure_group()
+        entries = self.__claim_stale(consumer, count)
+        if len(entries) == 0:
+            response = self.__redis_client.xreadgroup(
+                Outbox.__get_group_name(), consumer, {Outbox.__get_stream_key(): '>'}, count=count, block=block)
+            entries = response[0][1] if response else []
+        if len(entries) == 0:
+            return 0
+        messages = {message_id: build_email(**Outbox.__decode(fields)) for message_id, fields in entries}
+        summary = send_bulk_email(list(messages.values()))
+        failed = set(id(msg) for msg in summary['failed'])
+        self.__ack([message_id for message_id, msg in messages.items() if id(msg) not in failed])
+        logging.info('Sent {} emails, {} failed'.format(summary['sent'], len(summary['failed'])))
+        return len(entries)
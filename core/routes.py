@@ -1,55 +1,97 @@
-from datetime import datetime
 from core import app
 import redis
 from flask import request
 from enum import Enum
-import chaser
-from flask import render_template, flash, redirect, url_for, request
+from flask import render_template, flash, redirect, url_for, request, Response, abort
 from flask_login import login_user, logout_user, current_user, login_required
 from werkzeug.urls import url_parse
-from core import app, db
+from core import app, db, redis_client
 from core.forms import DramaChasingForm,LoginForm, RegistrationForm, EditProfileForm, ResetPasswordRequestForm, ResetPasswordForm
-from core.models import User
+from core.models import User, user_cache
+from core.dramas import DramaLibrary, InvalidDramaError
+from core.activity import tracker
+from core.live import stream_updates
 from core.email import send_password_reset_email
+from metrics import LAST_RUN_KEY, metrics, render
 import pickle
 import logging
-import sys
-reload(sys)
-sys.setdefaultencoding('utf-8')
+import hmac
+from functools import wraps
 
+# last seen times are written in batches by core.activity, static files don't count
+# metrics of every worker process reach redis within METRICS_FLUSH_INTERVAL
 @app.before_request
 def before_request():
-    if current_user.is_authenticated:
-        current_user.last_seen = datetime.utcnow()
-        db.session.commit()
+    metrics.flush_periodically(redis_client, app.config['METRICS_FLUSH_INTERVAL'])
+    if request.endpoint != 'static' and current_user.is_authenticated:
+        tracker.touch(current_user.id)
+
+# metrics are served to scrapers sending "Authorization: Bearer <METRICS_TOKEN>"
+# and to logged in admins
+def metrics_access_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = app.config['METRICS_TOKEN']
+        authorization = request.headers.get('Authorization', '').encode('utf-8')
+        if token is not None and hmac.compare_digest(authorization, 'Bearer {}'.format(token).encode('utf-8')):
+            return view(*args, **kwargs)
+        if current_user.is_authenticated and current_user.email in app.config['ADMINS']:
+            return view(*args, **kwargs)
+        abort(403)
+    return wrapper
+
+# prometheus scrape target, totals of all processes including cron runs as of
+# their last periodic flush
+@app.route('/metrics')
+@metrics_access_required
+def prometheus_metrics():
+    return Response(render(redis_client), mimetype='text/plain; version=0.0.4')
+
+@app.route('/metrics/last_run')
+@metrics_access_required
+def last_run_metrics():
+    return Response(redis_client.get(LAST_RUN_KEY) or '{}', mimetype='application/json')
 
 @app.route('/drama/abandon', methods=['DELETE'])
 @login_required
 def anandon_drama():
     user_id = current_user.email
     drama_id = request.form['drama_id']
-    drama_chaser = chaser.DramaChaser()
-    drama_chaser.abandon(user_id, drama_id)
+    DramaLibrary().abandon(user_id, drama_id)
     return {'status': 'OK'}
 
+# server-sent events with the new show list of the user's dramas
+@app.route('/drama/updates')
+@login_required
+def drama_updates():
+    drama_ids = DramaLibrary().get_user_drama_ids(current_user.email)
+    response = Response(stream_updates(drama_ids), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/', methods=['POST', 'GET'])
 @app.route('/index', methods=['POST', 'GET'])
 @login_required
 def index():
     form = DramaChasingForm()
     user_id = current_user.email
-    drama_chaser = chaser.DramaChaser()
+    library = DramaLibrary()
     if form.validate_on_submit():
         drama_id = form.drama_id.data
         try:
-            drama_name = drama_chaser.load_drama_name(drama_id)
-        except:
+            drama_name = library.load_drama_name(drama_id)
+        except InvalidDramaError:
             flash('Invalid drama id {}'.format(drama_id))
             return redirect(url_for('index'))
-        drama_chaser.chase(user_id, drama_id, drama_name)
+        except Exception as ex:
+            logging.error('Failed to load name of drama {}: {}'.format(drama_id, ex))
+            flash('Could not look up drama {}, please try again later'.format(drama_id))
+            return redirect(url_for('index'))
+        library.chase(user_id, drama_id, drama_name)
         flash('Start to chase drama {}'.format(drama_name))
         return redirect(url_for('index'))
-    drama_metadata = drama_chaser.get_drama_metadata(user_id)
+    drama_metadata = library.get_drama_metadata(user_id)
     return render_template('index.html', title='Home', drama_metadata=drama_metadata, form=form)
 
 @app.route('/login', methods=['GET', 'POST'])
@@ -84,6 +126,7 @@ def register():
         user.set_password(form.password.data)
         db.session.add(user)
         db.session.commit()
+        user_cache.invalidate(user.id)
         flash('Congratulations, you are now a registered user!')
         return redirect(url_for('login'))
     return render_template('register.html', title='Register', form=form)
@@ -99,9 +142,12 @@ def user(username):
 def edit_profile():
     form = EditProfileForm(current_user.username)
     if form.validate_on_submit():
-        current_user.username = form.username.data
-        current_user.about_me = form.about_me.data
+        # current_user is a cached copy, change the row itself
+        user = User.query.get(current_user.id)
+        user.username = form.username.data
+        user.about_me = form.about_me.data
         db.session.commit()
+        user_cache.invalidate(user.id)
         flash('Your changes have been saved.')
         return redirect(url_for('edit_profile'))
     elif request.method == 'GET':
@@ -137,6 +183,7 @@ def reset_password(token):
     if form.validate_on_submit():
         user.set_password(form.password.data)
         db.session.commit()
+        user_cache.invalidate(user.id)
         flash('Your password has been reset.')
         return redirect(url_for('login'))
     return render_template('reset_password.html', form=form)
\ No newline at end of file
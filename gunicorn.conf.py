@@ -0,0 +1,15 @@
+# gunicorn settings of the web app, run with: gunicorn -c gunicorn.conf.py
+# every tab keeps /drama/updates open for up to LIVE_STREAM_LIFETIME seconds, on
+# sync workers each open tab would hold a whole worker process, gevent workers
+# serve a stream as a greenlet and patch threads, locks and sockets so the
+# background threads of the app (metrics, activity, the update broker) keep working
+import multiprocessing
+import os
+
+wsgi_app = 'entry:app'
+bind = os.environ.get('GUNICORN_BIND') or '127.0.0.1:8000'
+worker_class = 'gevent'
+workers = int(os.environ.get('GUNICORN_WORKERS') or multiprocessing.cpu_count())
+# open streams and requests served at once by each worker
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS') or 1000)
+timeout = int(os.environ.get('GUNICORN_TIMEOUT') or 30)
@@ -0,0 +1,214 @@
+import atexit
+from bisect import bisect_left
+from contextlib import contextmanager
+import json
+import logging
+import os
+from threading import Lock, Thread
+import time
+import redis
+
+# upper bounds of the latency histogram buckets in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+PREFIX = 'dramachaser_'
+
+# key => metrics, hash {json [type, name, labels, field]: value} summed over all processes
+METRICS_KEY = 'metrics'
+# key => metrics:last_run, json summary of the latest cron run
+LAST_RUN_KEY = 'metrics:last_run'
+
+
+def format_labels(labels):
+    if len(labels) == 0:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels) + '}'
+
+
+def format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+class Histogram:
+    def __init__(self):
+        # counts[i] => observations in (BUCKETS[i - 1], BUCKETS[i]], the last one is +Inf
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+
+    # upper bound of the bucket holding quantile q
+    def quantile(self, q):
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS + (float('inf'),), self.counts):
+            seen += count
+            if count != 0 and seen >= rank:
+                return bound
+        return None
+
+
+# counters, gauges and latency histograms of this process keyed by (name, labels)
+# flush adds them to the totals of all processes in redis, where the
+# prometheus endpoint of the web app reads them
+class Metrics:
+    def __init__(self):
+        self.__lock = Lock()
+        self.__counters = {}
+        self.__gauges = {}
+        self.__histograms = {}
+        self.__flusher_pid = None
+
+    @staticmethod
+    def __get_key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def incr(self, name, value=1, **labels):
+        key = Metrics.__get_key(name, labels)
+        with self.__lock:
+            self.__counters[key] = self.__counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        key = Metrics.__get_key(name, labels)
+        with self.__lock:
+            self.__gauges[key] = value
+
+    def observe(self, name, seconds, **labels):
+        key = Metrics.__get_key(name, labels)
+        with self.__lock:
+            histogram = self.__histograms.get(key)
+            if histogram is None:
+                histogram = self.__histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - start, **labels)
+
+    # json friendly view of everything recorded since the last flush
+    def summary(self):
+        with self.__lock:
+            return {
+                'counters': {name + format_labels(labels): value for (name, labels), value in self.__counters.items()},
+                'gauges': {name + format_labels(labels): value for (name, labels), value in self.__gauges.items()},
+                'histograms': {
+                    name + format_labels(labels): {
+                        'count': histogram.count,
+                        'sum': round(histogram.sum, 6),
+                        'p50': histogram.quantile(0.5),
+                        'p99': histogram.quantile(0.99)
+                    } for (name, labels), histogram in self.__histograms.items()
+                }
+            }
+
+    # move everything recorded so far into the totals in redis
+    def flush(self, redis_client):
+        with self.__lock:
+            counters, gauges, histograms = self.__counters, self.__gauges, self.__histograms
+            self.__counters, self.__gauges, self.__histograms = {}, {}, {}
+        pipe = redis_client.pipeline(transaction=False)
+        for (name, labels), value in counters.items():
+            pipe.hincrbyfloat(METRICS_KEY, json.dumps(['counter', name, labels, '']), value)
+        for (name, labels), value in gauges.items():
+            pipe.hset(METRICS_KEY, json.dumps(['gauge', name, labels, '']), value)
+        for (name, labels), histogram in histograms.items():
+            for index, count in enumerate(histogram.counts):
+                if count != 0:
+                    pipe.hincrby(METRICS_KEY, json.dumps(['histogram', name, labels, index]), count)
+            pipe.hincrbyfloat(METRICS_KEY, json.dumps(['histogram', name, labels, 'sum']), histogram.sum)
+        pipe.execute()
+
+    # flush every interval seconds from a background thread and once more at exit,
+    # call it from every request, threads don't survive a fork so every worker
+    # process starts its own
+    def flush_periodically(self, redis_client, interval):
+        if self.__flusher_pid == os.getpid():
+            return
+        with self.__lock:
+            if self.__flusher_pid == os.getpid():
+                return
+            self.__flusher_pid = os.getpid()
+        Thread(target=self.__flush_forever, args=(redis_client, interval), daemon=True).start()
+        atexit.register(self.__safe_flush, redis_client)
+
+    def __flush_forever(self, redis_client, interval):
+        while True:
+            time.sleep(interval)
+            self.__safe_flush(redis_client)
+
+    def __safe_flush(self, redis_client):
+        try:
+            self.flush(redis_client)
+        except Exception as ex:
+            logging.error('Failed to flush metrics: {}'.format(ex))
+
+
+# prometheus text exposition of the totals in redis
+def render(redis_client):
+    counters = {}
+    gauges = {}
+    histograms = {}
+    for field, value in redis_client.hgetall(METRICS_KEY).items():
+        kind, name, labels, bucket = json.loads(field)
+        key = (name, tuple(tuple(label) for label in labels))
+        if kind == 'counter':
+            counters[key] = float(value)
+        elif kind == 'gauge':
+            gauges[key] = float(value)
+        else:
+            histogram = histograms.setdefault(key, Histogram())
+            if bucket == 'sum':
+                histogram.sum = float(value)
+            else:
+                histogram.counts[bucket] = int(value)
+    lines = []
+    for kind, values in (('counter', counters), ('gauge', gauges)):
+        for name in sorted({name for name, _ in values}):
+            lines.append('# TYPE {}{} {}'.format(PREFIX, name, kind))
+            for (metric, labels), value in sorted(values.items()):
+                if metric == name:
+                    lines.append('{}{}{} {}'.format(PREFIX, name, format_labels(labels), repr(value)))
+    for name in sorted({name for name, _ in histograms}):
+        lines.append('# TYPE {}{} histogram'.format(PREFIX, name))
+        for (metric, labels), histogram in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS + (float('inf'),), histogram.counts):
+                cumulative += count
+                lines.append('{}{}_bucket{} {}'.format(
+                    PREFIX, name, format_labels(labels + (('le', format_bound(bound)),)), cumulative))
+            lines.append('{}{}_sum{} {}'.format(PREFIX, name, format_labels(labels), repr(histogram.sum)))
+            lines.append('{}{}_count{} {}'.format(PREFIX, name, format_labels(labels), cumulative))
+    return '\n'.join(lines) + '\n'
+
+
+# metrics of this process
+metrics = Metrics()
+
+
+class TimedPipeline(redis.client.Pipeline):
+    def execute(self, raise_on_error=True):
+        with metrics.timer('redis_seconds', command='PIPELINE'):
+            return super().execute(raise_on_error)
+
+
+# redis client which records the latency of every command and pipeline
+class TimedRedis(redis.Redis):
+    def execute_command(self, *args, **options):
+        with metrics.timer('redis_seconds', command=args[0]):
+            return super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return TimedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
@@ -0,0 +1,196 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import logging
+import os
+import queue
+import time
+from selenium import webdriver
+from selenium.common.exceptions import StaleElementReferenceException, TimeoutException, WebDriverException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+
+# whole titles of the error pages served instead of a drama, drama pages are
+# titled after the drama and may contain any of these words
+ERROR_PAGE_TITLES = ('404', '404 Not Found', 'Not Found', 'Error', '500 Internal Server Error', '502 Bad Gateway',
+                     '503 Service Temporarily Unavailable', '504 Gateway Time-out')
+
+
+class ErrorPageError(Exception):
+    pass
+
+
+def headless_chrome():
+    options = webdriver.ChromeOptions()
+    options.add_argument('--headless')
+    options.add_argument('--disable-gpu')
+    options.add_argument('--no-sandbox')
+    return webdriver.Chrome(options=options)
+
+
+# wait condition: element is rendered and unchanged since the previous poll
+class ElementStable:
+    def __init__(self, tag_name, error_page_titles=ERROR_PAGE_TITLES):
+        self.__tag_name = tag_name
+        self.__error_page_titles = error_page_titles
+        self.__last_html = None
+
+    def __call__(self, driver):
+        title = (driver.title or '').strip()
+        if title in self.__error_page_titles:
+            raise ErrorPageError('Error page: {}'.format(title))
+        elements = driver.find_elements(By.TAG_NAME, self.__tag_name)
+        if len(elements) == 0:
+            return False
+        html = elements[0].get_attribute('innerHTML')
+        stable = html == self.__last_html
+        self.__last_html = html
+        return stable
+
+
+# build a wait callable which returns as soon as tag_name is stable,
+# raises TimeoutException after timeout seconds
+def wait_until_stable(tag_name, timeout, poll_frequency=0.25):
+    def wait(driver):
+        WebDriverWait(
+            driver, timeout, poll_frequency=poll_frequency,
+            ignored_exceptions=[StaleElementReferenceException]
+        ).until(ElementStable(tag_name))
+    return wait
+
+
+# browser and network failures are worth a retry, error pages and pages
+# which never render the waited for tag are not and don't trip the circuit
+def is_retriable(ex):
+    return isinstance(ex, WebDriverException) and not isinstance(ex, TimeoutException)
+
+
+# resident memory in bytes of pid and all of its descendants, None without /proc
+def get_process_tree_rss(pid):
+    children = {}
+    rss = {}
+    try:
+        proc_ids = [int(name) for name in os.listdir('/proc') if name.isdigit()]
+    except OSError:
+        return None
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    for proc_id in proc_ids:
+        try:
+            with open('/proc/{}/stat'.format(proc_id)) as stat:
+                # the command name in parentheses may contain spaces
+                fields = stat.read().rsplit(')', 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        children.setdefault(int(fields[1]), []).append(proc_id)
+        rss[proc_id] = int(fields[21]) * page_size
+    total = 0
+    pending = [pid]
+    while len(pending) != 0:
+        proc_id = pending.pop()
+        total += rss.get(proc_id, 0)
+        pending.extend(children.get(proc_id, []))
+    return total
+
+
+# a browser which is reused for several pages and restarted after max_pages
+class BrowserSession:
+    def __init__(self, driver_factory, max_pages, page_load_timeout=None):
+        self.__driver_factory = driver_factory
+        self.__max_pages = max_pages
+        self.__page_load_timeout = page_load_timeout
+        self.__driver = None
+        self.__pages = 0
+        # most memory the browser used right before it was closed
+        self.peak_memory = 0
+
+    def fetch(self, url, wait=None):
+        if self.__driver is None:
+            self.__driver = self.__driver_factory()
+            self.__pages = 0
+            if self.__page_load_timeout is not None:
+                self.__driver.set_page_load_timeout(self.__page_load_timeout)
+        try:
+            self.__driver.get(url)
+            if wait is not None:
+                wait(self.__driver)
+            return self.__driver.page_source
+        except Exception:
+            # the browser may be in a bad state, start a new one next time
+            self.close()
+            raise
+        finally:
+            self.__pages += 1
+            if self.__pages >= self.__max_pages:
+                self.close()
+
+    # resident memory of the driver and its browser processes, None if unknown
+    def get_memory(self):
+        try:
+            return get_process_tree_rss(self.__driver.service.process.pid)
+        except AttributeError:
+            return None
+
+    def close(self):
+        if self.__driver is None:
+            return
+        self.peak_memory = max(self.peak_memory, self.get_memory() or 0)
+        try:
+            self.__driver.quit()
+        except Exception as ex:
+            logging.error(ex)
+        finally:
+            self.__driver = None
+
+
+# bounded pool of browser sessions shared by worker threads
+class BrowserPool:
+    # every page load goes through throttle, a scraper.throttle.Throttle, if given
+    def __init__(self, size=4, max_pages=50, driver_factory=headless_chrome, page_load_timeout=None, throttle=None):
+        self.__sessions = queue.Queue()
+        for _ in range(size):
+            self.__sessions.put(BrowserSession(driver_factory, max_pages, page_load_timeout))
+        self.__throttle = throttle
+        self.__executor = ThreadPoolExecutor(max_workers=size)
+        self.__size = size
+        # key => seconds spent on the page, failed pages included
+        self.timings = {}
+        # sum of the peak memory of all browsers, known after close
+        self.peak_memory = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def fetch(self, url, wait=None):
+        session = self.__sessions.get()
+        try:
+            if self.__throttle is None:
+                return session.fetch(url, wait)
+            return self.__throttle.call(session.fetch, url, wait, retriable=is_retriable)
+        finally:
+            self.__sessions.put(session)
+
+    def __timed_fetch(self, key, url, wait):
+        start = time.time()
+        try:
+            return self.fetch(url, wait)
+        finally:
+            self.timings[key] = time.time() - start
+
+    # fetch pages concurrently, yield (key, page_source) as they complete
+    # urls => dict {key: url}, failed pages are logged and skipped
+    def fetch_all(self, urls, wait=None):
+        futures = {self.__executor.submit(self.__timed_fetch, key, url, wait): key for key, url in urls.items()}
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                yield key, future.result()
+            except Exception as ex:
+                logging.error('Failed to fetch {}: {}'.format(urls[key], ex))
+
+    def close(self):
+        self.__executor.shutdown(wait=True)
+        for _ in range(self.__size):
+            session = self.__sessions.get()
+            session.close()
+            self.peak_memory += session.peak_memory
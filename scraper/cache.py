@@ -0,0 +1,51 @@
+from collections import Counter, OrderedDict
+from threading import Lock
+import time
+
+
+# small thread safe in-process LRU cache whose entries expire after ttl seconds
+class LRUCache:
+    def __init__(self, maxsize=1024, ttl=300):
+        self.__maxsize = maxsize
+        self.__ttl = ttl
+        self.__entries = OrderedDict()
+        self.__lock = Lock()
+
+    # returns None on a miss
+    def get(self, key):
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                return None
+            value, expire_time = entry
+            if expire_time < time.time():
+                del self.__entries[key]
+                return None
+            self.__entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.__lock:
+            self.__entries[key] = (value, time.time() + self.__ttl)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.__maxsize:
+                self.__entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.__lock:
+            self.__entries.pop(key, None)
+
+
+# thread safe hit and miss counters
+class CacheStats:
+    def __init__(self):
+        self.__counts = Counter()
+        self.__lock = Lock()
+
+    def incr(self, name):
+        with self.__lock:
+            self.__counts[name] += 1
+
+    def as_dict(self):
+        with self.__lock:
+            return dict(self.__counts)
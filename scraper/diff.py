@@ -0,0 +1,25 @@
+from collections import namedtuple
+
+# added => [episode of current_show_list]
+# removed => [(play_id, title)]
+# renamed => [(play_id, old_title, new_title)]
+EpisodeDiff = namedtuple('EpisodeDiff', ['added', 'removed', 'renamed'])
+
+
+# compare two lists of (play_id, title, ...) episodes in linear time
+# episodes are matched by play_id, order of current_show_list is kept and
+# added holds its episodes as given
+def diff_show_lists(current_show_list, old_show_list):
+    old_titles = {episode[0]: episode[1] for episode in old_show_list}
+    current_play_ids = set()
+    added = []
+    renamed = []
+    for episode in current_show_list:
+        play_id, title = episode[0], episode[1]
+        current_play_ids.add(play_id)
+        if play_id not in old_titles:
+            added.append(episode)
+        elif old_titles[play_id] != title:
+            renamed.append((play_id, old_titles[play_id], title))
+    removed = [(episode[0], episode[1]) for episode in old_show_list if episode[0] not in current_play_ids]
+    return EpisodeDiff(added, removed, renamed)
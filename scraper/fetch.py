@@ -0,0 +1,126 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+import logging
+from threading import Lock
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import metrics
+
+# returned instead of the page when the server answers 304
+NOT_MODIFIED = object()
+
+# characters read at a time from a streamed page
+STREAM_CHUNK_SIZE = 16384
+
+USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/85.0 Safari/537.36'
+
+
+def new_session(pool_size=10):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = USER_AGENT
+    return session
+
+
+# keep-alive session shared by all plain http fetches of this process, it keeps
+# pool_size connections per host, concurrent fetches reserve theirs with reserve_pool
+session = new_session()
+pool_size = 10
+reserved = 0
+pool_lock = Lock()
+
+
+# keep the connections of concurrency more fetches per host alive while in the
+# block, the pool grows to what all blocks in flight reserved, a bigger pool comes
+# with a new session so requests in flight on the old one are not disturbed
+@contextmanager
+def reserve_pool(concurrency):
+    global session, pool_size, reserved
+    with pool_lock:
+        reserved += concurrency
+        if reserved > pool_size:
+            session = new_session(reserved)
+            pool_size = reserved
+    try:
+        yield
+    finally:
+        with pool_lock:
+            reserved -= concurrency
+
+
+# connection problems, timeouts and server side errors are worth a retry
+def is_retriable(ex):
+    return isinstance(ex, (requests.ConnectionError, requests.Timeout, requests.HTTPError))
+
+
+# with stream only the headers are read, the caller closes the response
+def send(url, headers=None, timeout=10, stream=False):
+    with metrics.timer('http_request_seconds'):
+        response = session.get(url, headers=headers, timeout=timeout, stream=stream)
+    metrics.incr('http_responses_total', status=response.status_code)
+    if response.status_code >= 500 or response.status_code == 429:
+        response.close()
+        response.raise_for_status()
+    return response
+
+
+# go through throttle, a scraper.throttle.Throttle, if given
+def get(url, headers=None, timeout=10, throttle=None, stream=False):
+    if throttle is None:
+        return send(url, headers, timeout, stream)
+    return throttle.call(send, url, headers, timeout, stream, retriable=is_retriable)
+
+
+def get_page(url, timeout=10, throttle=None):
+    response = get(url, timeout=timeout, throttle=throttle)
+    response.raise_for_status()
+    return response.text
+
+
+# conditional GET with validators from the previous response
+# returns (page, validators), page is NOT_MODIFIED if nothing changed
+# read(chunks), if given, consumes the body as an iterable of string chunks and
+# returns what is returned instead of the page, the rest of the body is never read
+def get_page_if_modified(url, validators, timeout=10, throttle=None, read=None):
+    headers = {}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+    response = get(url, headers, timeout, throttle, stream=read is not None)
+    try:
+        if response.status_code == 304:
+            return NOT_MODIFIED, validators
+        response.raise_for_status()
+        validators = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified')
+        }
+        if read is None:
+            return response.text, validators
+        # without a charset iter_content would yield bytes
+        response.encoding = response.encoding or 'utf-8'
+        return read(response.iter_content(chunk_size=STREAM_CHUNK_SIZE, decode_unicode=True)), validators
+    finally:
+        response.close()
+
+
+# fetch pages concurrently, yield (key, page, validators) as they complete
+# urls => dict {key: url}, all_validators => dict {key: validators}
+# read => see get_page_if_modified, page and validators are None if the fetch failed
+def fetch_all(urls, all_validators, concurrency=4, timeout=10, throttle=None, read=None):
+    with reserve_pool(concurrency), ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {
+            executor.submit(get_page_if_modified, url, all_validators.get(key, {}), timeout, throttle, read): key
+            for key, url in urls.items()
+        }
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                page, validators = future.result()
+                yield key, page, validators
+            except Exception as ex:
+                logging.error('Failed to fetch {}: {}'.format(urls[key], ex))
+                yield key, None, None
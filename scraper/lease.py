@@ -0,0 +1,83 @@
+import logging
+import os
+import socket
+from threading import Event, Lock, Thread
+import uuid
+
+# only the owner may extend or release a lease
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+# exclusive, expiring claims on dramas shared by all cron workers
+# key => lease:{drama_id}, value => worker id, expires after ttl seconds
+# held leases are renewed in background until released, leases of a dead
+# worker expire and can be claimed by others
+class LeaseManager:
+    def __init__(self, redis_client, ttl=120):
+        self.__redis_client = redis_client
+        self.__ttl_ms = int(ttl * 1000)
+        self.__worker_id = '{}-{}-{}'.format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        self.__renew_script = redis_client.register_script(RENEW_SCRIPT)
+        self.__release_script = redis_client.register_script(RELEASE_SCRIPT)
+        self.__held = set()
+        self.__lock = Lock()
+        self.__stopped = Event()
+        self.__heartbeat = Thread(target=self.__renew_forever, daemon=True)
+
+    @staticmethod
+    def __get_lease_key(drama_id):
+        return "lease:{}".format(drama_id)
+
+    def __enter__(self):
+        self.__heartbeat.start()
+        return self
+
+    def __exit__(self, *args):
+        self.__stopped.set()
+        self.__heartbeat.join()
+        self.release_all(list(self.__held))
+
+    def __renew_forever(self):
+        while not self.__stopped.wait(self.__ttl_ms / 3000.0):
+            with self.__lock:
+                held = list(self.__held)
+            for drama_id in held:
+                try:
+                    if not self.__renew_script(
+                            keys=[LeaseManager.__get_lease_key(drama_id)], args=[self.__worker_id, self.__ttl_ms]):
+                        with self.__lock:
+                            # released since the snapshot, nothing was lost
+                            if drama_id not in self.__held:
+                                continue
+                            self.__held.discard(drama_id)
+                        logging.error('Lost lease on drama {}'.format(drama_id))
+                except Exception as ex:
+                    logging.error('Failed to renew lease on drama {}: {}'.format(drama_id, ex))
+
+    # claim as many of drama_ids as possible, return the claimed ones
+    def acquire_all(self, drama_ids):
+        pipe = self.__redis_client.pipeline(transaction=False)
+        for drama_id in drama_ids:
+            pipe.set(LeaseManager.__get_lease_key(drama_id), self.__worker_id, px=self.__ttl_ms, nx=True)
+        claimed = [drama_id for drama_id, ok in zip(drama_ids, pipe.execute()) if ok]
+        with self.__lock:
+            self.__held.update(claimed)
+        return claimed
+
+    def release_all(self, drama_ids):
+        with self.__lock:
+            self.__held.difference_update(drama_ids)
+        for drama_id in drama_ids:
+            self.__release_script(keys=[LeaseManager.__get_lease_key(drama_id)], args=[self.__worker_id])
@@ -0,0 +1,153 @@
+from collections import namedtuple
+import html
+import re
+from urllib.parse import parse_qs, urlparse
+
+MEDIA_LIST_START = '<app-media-list'
+MEDIA_LIST_END = '</app-media-list>'
+PLAY_PREFIX = '/play?id='
+# start of the usual episode link
+PLAIN_LINK = '<a href="' + PLAY_PREFIX
+WHITESPACE = ' \t\r\n\f'
+TAG_NAME = re.compile(r'[^\s/>]*')
+# one attribute of a tag or its closing '>', after any whitespace and slashes
+ATTRIBUTE = re.compile(
+    r'[\s/]*(?:>|(?P<name>[^\s=/>]+)'
+    r'(?:\s*=\s*(?:"(?P<double>[^"]*)"|\'(?P<single>[^\']*)\'|(?P<unquoted>[^\s>"\'][^\s>]*)))?)')
+
+# play_id => id of the episode's play page
+# title => link text
+# ordinal => 1 based position in the media list
+Episode = namedtuple('Episode', ['play_id', 'title', 'ordinal'])
+
+
+class ParseError(Exception):
+    pass
+
+
+# attributes of the tag starting at markup[start] and the position after its
+# closing '>', quoted values may hold '>', values are not unescaped
+# returns ({name: value}, -1) if the tag is not closed
+def parse_tag(markup, start):
+    attributes = {}
+    pos = TAG_NAME.match(markup, start + 1).end()
+    while True:
+        match_obj = ATTRIBUTE.match(markup, pos)
+        if match_obj is None:
+            return attributes, -1
+        pos = match_obj.end()
+        name, value, single_quoted, unquoted = match_obj.group('name', 'double', 'single', 'unquoted')
+        if name is None:
+            return attributes, pos
+        if value is None:
+            value = single_quoted if single_quoted is not None else unquoted or ''
+        # the first of repeated attributes wins, like in browsers
+        attributes.setdefault(name.lower(), value)
+
+
+def get_text(markup):
+    if '<' not in markup and '&' not in markup:
+        return ' '.join(markup.split())
+    text = []
+    pos = 0
+    while True:
+        tag_start = markup.find('<', pos)
+        if tag_start < 0:
+            text.append(markup[pos:])
+            break
+        text.append(markup[pos:tag_start])
+        tag_end = markup.find('>', tag_start)
+        if tag_end < 0:
+            break
+        pos = tag_end + 1
+    return ' '.join(html.unescape(''.join(text)).split())
+
+
+def get_play_id(href):
+    if href.startswith(PLAY_PREFIX) and '&' not in href:
+        return href[len(PLAY_PREFIX):] or None
+    url = urlparse(html.unescape(href))
+    if url.path != '/play':
+        return None
+    return parse_qs(url.query).get('id', [None])[0]
+
+
+# fast path for the usual markup where every link is <a href="/play?id=...">
+# around plain text, splits the whole fragment at once instead of scanning it
+# link by link, returns None if the fragment needs scan_links, as it does for
+# links with any attribute but href
+def parse_plain_links(fragment):
+    if '&' in fragment:
+        return None
+    pieces = fragment.split(PLAIN_LINK)
+    del pieces[0]
+    if len(pieces) != fragment.count('<a') or len(pieces) != fragment.count('</a>'):
+        return None
+    # [play_id, '">', title], any other attribute leaves a quote in play_id
+    links = [piece.partition('</a>')[0].partition('">') for piece in pieces]
+    play_ids = [link[0] for link in links]
+    titles = [' '.join(link[2].split()) for link in links]
+    if '' in play_ids or '"' in ''.join(play_ids) or '<' in ''.join(titles):
+        return None
+    return list(map(Episode._make, zip(play_ids, titles, range(1, len(titles) + 1))))
+
+
+# scan the markup between <app-media-list ...> and </app-media-list> for
+# episode links one tag at a time
+def scan_links(fragment):
+    episodes = []
+    pos = 0
+    while True:
+        link_start = fragment.find('<a', pos)
+        if link_start < 0:
+            return episodes
+        pos = link_start + 2
+        if fragment[pos:pos + 1] not in WHITESPACE:
+            continue
+        attributes, tag_end = parse_tag(fragment, link_start)
+        link_end = fragment.find('</a>', tag_end) if tag_end >= 0 else -1
+        if link_end < 0:
+            raise ParseError('Unclosed episode link at {}'.format(link_start))
+        pos = link_end + 4
+        play_id = get_play_id(attributes.get('href', ''))
+        if play_id is not None:
+            episodes.append(Episode(play_id, get_text(fragment[tag_end:link_end]), len(episodes) + 1))
+
+
+# episodes of the markup returned by find_media_list
+def parse_fragment(fragment):
+    episodes = parse_plain_links(fragment)
+    return scan_links(fragment) if episodes is None else episodes
+
+
+# markup between <app-media-list ...> and </app-media-list> of an ifvod detail
+# page, page is a string or an iterable of string chunks which is not read
+# past </app-media-list>
+# raises ParseError if the page has no complete media list
+def find_media_list(page):
+    chunks = (page,) if isinstance(page, str) else page
+    buffer = ''
+    start = -1
+    for chunk in chunks:
+        # keep enough of the previous chunk to find markers split across chunks
+        search_from = max(0, len(buffer) - len(MEDIA_LIST_END))
+        buffer += chunk
+        if start < 0:
+            start = buffer.find(MEDIA_LIST_START)
+            if start < 0:
+                buffer = buffer[-len(MEDIA_LIST_START):]
+                continue
+            buffer = buffer[start:]
+            search_from = 0
+            start = 0
+        end = buffer.find(MEDIA_LIST_END, search_from)
+        if end >= 0:
+            return buffer[buffer.find('>') + 1:end]
+    if start < 0:
+        raise ParseError('No <app-media-list> found')
+    raise ParseError('<app-media-list> is not closed')
+
+
+# parse the episode list of an ifvod detail page, see find_media_list
+def parse_media_list(page):
+    return parse_fragment(find_media_list(page))
@@ -0,0 +1,97 @@
+from enum import Enum
+import re
+from scraper.parser import find_media_list, parse_fragment
+
+
+class FetchStrategy(Enum):
+    # plain http first, a browser only for pages http can't parse
+    HTTP = 1
+    # every page is rendered in a browser
+    BROWSER = 2
+
+
+# everything the chaser needs to know about one VOD site
+# drama ids of a provider are its site ids behind prefix so dramas of all
+# sites share the same redis keys, the first provider keeps an empty prefix
+class Provider:
+    name = None
+    domain = None
+    prefix = ''
+    fetch_strategy = FetchStrategy.HTTP
+    # tag the browser waits for until it stops changing
+    wait_tag = None
+
+    def __init__(self, pool_size, rate, burst):
+        self.pool_size = pool_size
+        self.rate = rate
+        self.burst = burst
+
+    def owns(self, drama_id):
+        return drama_id.startswith(self.prefix)
+
+    def get_site_id(self, drama_id):
+        return drama_id[len(self.prefix):]
+
+    def get_drama_id(self, site_id):
+        return self.prefix + site_id
+
+    # page the drama name is parsed from
+    def get_metadata_url(self, drama_id):
+        raise NotImplementedError
+
+    # page the episode list is parsed from
+    def get_episodes_url(self, drama_id):
+        raise NotImplementedError
+
+    def get_play_url(self, play_id):
+        raise NotImplementedError
+
+    # raw markup of the episode list, it changes whenever the episodes do
+    # page is a string or an iterable of string chunks which is not read past the list
+    # raises ParseError if the page has no complete episode list
+    def find_show_list(self, page):
+        raise NotImplementedError
+
+    # returns list of scraper.parser.Episode out of the markup found by find_show_list
+    def parse_show_list(self, markup):
+        raise NotImplementedError
+
+    # returns None if the site doesn't know the drama
+    def parse_drama_name(self, page):
+        raise NotImplementedError
+
+    # drama id out of the drama link rendered on the index page, None if it isn't ours
+    def parse_drama_id(self, link):
+        raise NotImplementedError
+
+
+class IFVODProvider(Provider):
+    name = 'ifvod'
+    domain = 'www.ifvod.tv'
+    base_url = 'https://www.ifvod.tv'
+    wait_tag = 'app-media-list'
+
+    def get_metadata_url(self, drama_id):
+        return "{}/detail?id={}".format(self.base_url, self.get_site_id(drama_id))
+
+    def get_episodes_url(self, drama_id):
+        return self.get_metadata_url(drama_id)
+
+    def get_play_url(self, play_id):
+        return "{}/play?id={}".format(self.base_url, play_id)
+
+    def find_show_list(self, page):
+        return find_media_list(page)
+
+    def parse_show_list(self, markup):
+        return parse_fragment(markup)
+
+    def parse_drama_name(self, page):
+        match_obj = re.search('<meta.*?name="title".*?content="(.*?) - IFVOD".*?/>', page)
+        return None if match_obj is None else match_obj.group(1)
+
+    def parse_drama_id(self, link):
+        if self.domain not in link:
+            return None
+        match_obj = re.search('id=(.*?)">', link)
+        return None if match_obj is None else self.get_drama_id(match_obj.group(1))
@@ -0,0 +1,91 @@
+import json
+import time
+
+# keep this many release times to learn the cadence from
+MAX_RELEASE_HISTORY = 10
+
+
+# decide when each drama should be polled next
+# key => schedule, sorted set {drama_id: next due time}
+# key => {drama_id}:cadence
+# value => dict {
+#   release_times:<times new episodes were detected>,
+#   misses:<polls without new episodes since the last release>
+# }
+class PollScheduler:
+    def __init__(self, redis_client, min_interval=900, default_interval=3600, max_interval=604800):
+        self.__redis_client = redis_client
+        self.__min_interval = min_interval
+        self.__default_interval = default_interval
+        self.__max_interval = max_interval
+
+    @staticmethod
+    def __get_schedule_key():
+        return 'schedule'
+
+    @staticmethod
+    def __get_cadence_key(drama_id):
+        return "{}:cadence".format(drama_id)
+
+    @staticmethod
+    def __median(values):
+        values = sorted(values)
+        middle = len(values) // 2
+        return values[middle] if len(values) % 2 == 1 else (values[middle - 1] + values[middle]) / 2.0
+
+    def __clamp(self, interval):
+        return max(self.__min_interval, min(interval, self.__max_interval))
+
+    def get_next_interval(self, cadence, now):
+        release_times = cadence['release_times']
+        misses = cadence['misses']
+        if len(release_times) < 2:
+            return self.__clamp(self.__default_interval * 2 ** misses)
+        release_interval = PollScheduler.__median(
+            [b - a for a, b in zip(release_times, release_times[1:])])
+        expected_release_time = release_times[-1] + release_interval
+        if now < expected_release_time:
+            # sleep until the next episode is expected
+            return self.__clamp(expected_release_time - now)
+        # overdue, poll often at first then back off for stale or finished dramas
+        return self.__clamp(self.__min_interval * 2 ** max(misses - 1, 0))
+
+    # dramas without a schedule are due immediately
+    def get_due(self, drama_ids, now=None):
+        now = time.time() if now is None else now
+        drama_ids = list(drama_ids)
+        pipe = self.__redis_client.pipeline(transaction=False)
+        for drama_id in drama_ids:
+            pipe.zscore(PollScheduler.__get_schedule_key(), drama_id)
+        scores = pipe.execute()
+        return [drama_id for drama_id, score in zip(drama_ids, scores) if score is None or score <= now]
+
+    def add(self, drama_id):
+        self.__redis_client.zadd(PollScheduler.__get_schedule_key(), {drama_id: time.time()}, nx=True)
+
+    # forget a drama nobody follows anymore, queued on pipe if given so it can
+    # run in the caller's transaction
+    def remove(self, drama_id, pipe=None):
+        client = self.__redis_client if pipe is None else pipe
+        client.zrem(PollScheduler.__get_schedule_key(), drama_id)
+        client.delete(PollScheduler.__get_cadence_key(drama_id))
+
+    # record the outcome of polling drama_ids and schedule their next poll
+    def reschedule(self, drama_ids, changed_drama_ids, now=None):
+        now = time.time() if now is None else now
+        drama_ids = list(drama_ids)
+        if len(drama_ids) == 0:
+            return
+        values = self.__redis_client.mget([PollScheduler.__get_cadence_key(drama_id) for drama_id in drama_ids])
+        pipe = self.__redis_client.pipeline()
+        for drama_id, value in zip(drama_ids, values):
+            cadence = {'release_times': [], 'misses': 0} if value is None else json.loads(value)
+            if drama_id in changed_drama_ids:
+                cadence['release_times'] = (cadence['release_times'] + [now])[-MAX_RELEASE_HISTORY:]
+                cadence['misses'] = 0
+            else:
+                cadence['misses'] += 1
+            next_due_time = now + self.get_next_interval(cadence, now)
+            pipe.set(PollScheduler.__get_cadence_key(drama_id), json.dumps(cadence))
+            pipe.zadd(PollScheduler.__get_schedule_key(), {drama_id: next_due_time})
+        pipe.execute()
@@ -0,0 +1,161 @@
+import logging
+import random
+from threading import BoundedSemaphore, Lock
+import time
+
+# take one token from the bucket, returns milliseconds to wait if it is empty
+# time comes from the redis server so clock skew between hosts doesn't matter,
+# effects replication lets the script write after reading the time
+TOKEN_BUCKET_SCRIPT = """
+redis.replicate_commands()
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('time')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local bucket = redis.call('hmget', KEYS[1], 'tokens', 'time')
+local tokens = tonumber(bucket[1]) or burst
+local last = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - last) * rate / 1000)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) * 1000 / rate)
+end
+redis.call('hset', KEYS[1], 'tokens', tokens, 'time', now)
+redis.call('pexpire', KEYS[1], math.ceil(burst * 1000 / rate) + 1000)
+return wait
+"""
+
+# returns 0 if the circuit is closed, 1 if the caller is the probe of a
+# half-open circuit and -1 if the call must not go through
+CIRCUIT_CHECK_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 1 then
+    return -1
+end
+if (tonumber(redis.call('get', KEYS[2])) or 0) < tonumber(ARGV[1]) then
+    return 0
+end
+if redis.call('set', KEYS[3], 1, 'nx', 'ex', ARGV[2]) then
+    return 1
+end
+return -1
+"""
+
+# key => domain, value => BoundedSemaphore shared by all throttles of the domain
+semaphores = {}
+semaphores_lock = Lock()
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+# token bucket shared by all processes through redis
+# key => throttle:{domain}:bucket, hash {tokens, time}
+class TokenBucket:
+    def __init__(self, redis_client, key, rate, burst):
+        self.__key = key
+        self.__rate = rate
+        self.__burst = burst
+        self.__script = redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def acquire(self):
+        while True:
+            wait = self.__script(keys=[self.__key], args=[self.__rate, self.__burst])
+            if wait == 0:
+                return
+            time.sleep(wait / 1000.0)
+
+
+# stop calling a domain for reset_timeout seconds after failure_threshold
+# failures in a row, then let a single probe call through, its success closes
+# the circuit and its failure opens it again, shared by all processes through redis
+# key => throttle:{domain}:failures, consecutive failures
+# key => throttle:{domain}:open, exists while the circuit is open
+# key => throttle:{domain}:probe, exists while the probe of a half-open circuit is in flight
+class CircuitBreaker:
+    def __init__(self, redis_client, key_prefix, failure_threshold, reset_timeout):
+        self.__redis_client = redis_client
+        self.__failures_key = '{}:failures'.format(key_prefix)
+        self.__open_key = '{}:open'.format(key_prefix)
+        self.__probe_key = '{}:probe'.format(key_prefix)
+        self.__failure_threshold = failure_threshold
+        self.__reset_timeout = reset_timeout
+        self.__check_script = redis_client.register_script(CIRCUIT_CHECK_SCRIPT)
+
+    # returns True if the caller is the probe of a half-open circuit, it must
+    # record its outcome or release the probe
+    def check(self):
+        state = self.__check_script(
+            keys=[self.__open_key, self.__failures_key, self.__probe_key],
+            args=[self.__failure_threshold, self.__reset_timeout])
+        if state < 0:
+            raise CircuitOpenError('Circuit {} is open'.format(self.__open_key))
+        return state == 1
+
+    def record_success(self):
+        self.__redis_client.delete(self.__failures_key, self.__probe_key)
+
+    def record_failure(self):
+        pipe = self.__redis_client.pipeline()
+        pipe.incr(self.__failures_key)
+        pipe.expire(self.__failures_key, self.__reset_timeout * 10)
+        failures = pipe.execute()[0]
+        if failures >= self.__failure_threshold:
+            logging.error('Opening circuit {} after {} failures'.format(self.__open_key, failures))
+            pipe = self.__redis_client.pipeline()
+            pipe.set(self.__open_key, 1, ex=self.__reset_timeout)
+            pipe.delete(self.__probe_key)
+            pipe.execute()
+
+    # let another probe through, the outcome of this one proved nothing
+    def release_probe(self):
+        self.__redis_client.delete(self.__probe_key)
+
+
+# one semaphore per domain and process, the first throttle of a domain sets its size
+def get_semaphore(domain, concurrency):
+    with semaphores_lock:
+        if domain not in semaphores:
+            semaphores[domain] = BoundedSemaphore(concurrency)
+        return semaphores[domain]
+
+
+# rate limit, bound concurrency, retry with jittered backoff and trip a
+# circuit breaker around every call to one domain
+# rate, burst and the circuit are shared by all processes, at most concurrency
+# calls to a domain run at once in each process however many throttles it builds
+class Throttle:
+    def __init__(self, redis_client, domain, rate=5, burst=10, concurrency=8, retries=3, backoff=1.0,
+                 failure_threshold=10, reset_timeout=60):
+        key_prefix = 'throttle:{}'.format(domain)
+        self.__bucket = TokenBucket(redis_client, '{}:bucket'.format(key_prefix), rate, burst)
+        self.__circuit = CircuitBreaker(redis_client, key_prefix, failure_threshold, reset_timeout)
+        self.__semaphore = get_semaphore(domain, concurrency)
+        self.__retries = retries
+        self.__backoff = backoff
+
+    # retriable(ex) tells transient failures, which are retried and count
+    # against the circuit, from errors like missing pages
+    def call(self, fn, *args, retriable=lambda ex: True, **kwargs):
+        attempt = 0
+        while True:
+            probe = self.__circuit.check()
+            self.__bucket.acquire()
+            try:
+                with self.__semaphore:
+                    result = fn(*args, **kwargs)
+            except Exception as ex:
+                if not retriable(ex):
+                    if probe:
+                        self.__circuit.release_probe()
+                    raise
+                self.__circuit.record_failure()
+                attempt += 1
+                if attempt > self.__retries:
+                    raise
+                time.sleep(self.__backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+                continue
+            self.__circuit.record_success()
+            return result
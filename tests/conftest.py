@@ -0,0 +1,47 @@
+# the app reads its config when core is imported, so a throwaway redis-server
+# and sqlite database are set up before any test module is collected
+import os
+import shutil
+import tempfile
+import pytest
+from benchmarks.load_test import start_redis, stop_redis
+
+redis_process = None
+
+
+def pytest_configure(config):
+    global redis_process
+    tmpdir = tempfile.mkdtemp(prefix='dramachaser-tests-')
+    config.add_cleanup(lambda: shutil.rmtree(tmpdir, ignore_errors=True))
+    os.environ.update({
+        'FLASK_DEBUG': '1',
+        'DATABASE_URL': 'sqlite:///' + os.path.join(tmpdir, 'test.db'),
+        'ACTIVITY_NO_SHUTDOWN_FLUSH': '1'
+    })
+    try:
+        redis_process, port = start_redis(os.environ.get('REDIS_SERVER') or 'redis-server')
+    except (OSError, RuntimeError):
+        return
+    config.add_cleanup(lambda: stop_redis(redis_process))
+    os.environ.update({'REDIS_HOST': '127.0.0.1', 'REDIS_PORT': str(port), 'REDIS_DB': '0'})
+
+
+# the shared client of the app against an empty database
+@pytest.fixture
+def redis_client():
+    if redis_process is None:
+        pytest.skip('redis-server is not available')
+    from core import redis_client
+    redis_client.flushdb()
+    return redis_client
+
+
+# empty user table
+@pytest.fixture
+def db():
+    from core import app, db
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield db
+        db.session.remove()
@@ -0,0 +1,57 @@
+from datetime import datetime
+import time
+from core.activity import ActivityTracker
+from core.models import User
+
+
+def add_user(db, username):
+    user = User(username=username, email='{}@x.com'.format(username), last_seen=datetime(2020, 1, 1))
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+
+def get_last_seen(db, user_id):
+    db.session.expire_all()
+    return User.query.get(user_id).last_seen
+
+
+def test_flush_writes_latest_times_in_one_batch(db):
+    user_ids = [add_user(db, 'user{}'.format(i)) for i in range(3)]
+    tracker = ActivityTracker(flush_interval=3600)
+    before = datetime.utcnow()
+    tracker.touch(user_ids[0])
+    tracker.touch(user_ids[1])
+    tracker.touch(user_ids[0])
+    assert get_last_seen(db, user_ids[0]) == datetime(2020, 1, 1)
+    assert tracker.flush() == 2
+    assert get_last_seen(db, user_ids[0]) >= before
+    assert get_last_seen(db, user_ids[1]) >= before
+    assert get_last_seen(db, user_ids[2]) == datetime(2020, 1, 1)
+    # nothing left to write
+    assert tracker.flush() == 0
+
+
+def test_failed_flush_keeps_times(db, monkeypatch):
+    user_id = add_user(db, 'alice')
+    tracker = ActivityTracker(flush_interval=3600)
+    tracker.touch(user_id)
+
+    def fail(*args, **kwargs):
+        raise RuntimeError('database is down')
+    with monkeypatch.context() as patch:
+        patch.setattr(db.session, 'execute', fail)
+        assert tracker.flush() == 0
+    assert get_last_seen(db, user_id) == datetime(2020, 1, 1)
+    assert tracker.flush() == 1
+    assert get_last_seen(db, user_id) > datetime(2020, 1, 1)
+
+
+def test_background_flush(db):
+    user_id = add_user(db, 'bob')
+    tracker = ActivityTracker(flush_interval=0.05)
+    tracker.touch(user_id)
+    deadline = time.time() + 5
+    while get_last_seen(db, user_id) == datetime(2020, 1, 1) and time.time() < deadline:
+        time.sleep(0.05)
+    assert get_last_seen(db, user_id) > datetime(2020, 1, 1)
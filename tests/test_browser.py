@@ -0,0 +1,162 @@
+from threading import Event, Lock, Thread
+import time
+import pytest
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from scraper.browser import BrowserPool, BrowserSession, ElementStable, ErrorPageError, is_retriable
+
+
+# in-memory stand-in for a selenium driver, url => page source or an exception
+class FakeDriver:
+    def __init__(self, pages, fleet):
+        self.__pages = pages
+        self.__fleet = fleet
+        self.title = ''
+        self.page_source = ''
+        self.quit_called = False
+        self.timeout = None
+        fleet.started.append(self)
+
+    def set_page_load_timeout(self, timeout):
+        self.timeout = timeout
+
+    def get(self, url):
+        with self.__fleet.lock:
+            self.__fleet.running += 1
+            self.__fleet.most_running = max(self.__fleet.most_running, self.__fleet.running)
+        try:
+            page = self.__pages[url]
+            if callable(page):
+                page = page()
+            if isinstance(page, Exception):
+                raise page
+            self.page_source = page
+        finally:
+            with self.__fleet.lock:
+                self.__fleet.running -= 1
+
+    def quit(self):
+        self.quit_called = True
+
+
+# every driver started by a factory and how many pages load at once
+class Fleet:
+    def __init__(self, pages):
+        self.lock = Lock()
+        self.started = []
+        self.running = 0
+        self.most_running = 0
+        self.factory = lambda: FakeDriver(pages, self)
+
+
+def test_session_recycles_browser_after_max_pages():
+    fleet = Fleet({'a': 'A', 'b': 'B'})
+    session = BrowserSession(fleet.factory, max_pages=2, page_load_timeout=7)
+    assert [session.fetch(url) for url in ('a', 'b', 'a', 'b', 'a')] == ['A', 'B', 'A', 'B', 'A']
+    assert len(fleet.started) == 3
+    assert [driver.quit_called for driver in fleet.started] == [True, True, False]
+    assert all(driver.timeout == 7 for driver in fleet.started)
+    session.close()
+    assert fleet.started[-1].quit_called
+
+
+def test_session_restarts_browser_after_error():
+    fleet = Fleet({'ok': 'OK', 'broken': WebDriverException('tab crashed')})
+    session = BrowserSession(fleet.factory, max_pages=50)
+    assert session.fetch('ok') == 'OK'
+    with pytest.raises(WebDriverException):
+        session.fetch('broken')
+    assert fleet.started[0].quit_called
+    assert session.fetch('ok') == 'OK'
+    assert len(fleet.started) == 2
+
+
+def test_session_runs_wait_on_the_driver():
+    fleet = Fleet({'a': 'A'})
+    session = BrowserSession(fleet.factory, max_pages=50)
+    waited = []
+    session.fetch('a', wait=waited.append)
+    assert waited == fleet.started
+
+
+def test_pool_bounds_concurrency():
+    release = Event()
+
+    def slow_page():
+        release.wait(5)
+        return 'page'
+    fleet = Fleet({'d{}'.format(i): slow_page for i in range(10)})
+    pool = BrowserPool(size=3, max_pages=50, driver_factory=fleet.factory)
+    urls = {'d{}'.format(i): 'd{}'.format(i) for i in range(10)}
+    results = []
+    consumer = Thread(target=lambda: results.extend(pool.fetch_all(urls)))
+    consumer.start()
+    deadline = time.time() + 5
+    while fleet.running < 3 and time.time() < deadline:
+        time.sleep(0.01)
+    # give a fourth page the chance to start if the pool let it
+    time.sleep(0.1)
+    assert fleet.running == 3
+    release.set()
+    consumer.join()
+    assert sorted(results) == sorted(('d{}'.format(i), 'page') for i in range(10))
+    assert fleet.most_running == 3
+    # sessions are reused, never more browsers than the pool size
+    assert len(fleet.started) == 3
+    pool.close()
+    assert all(driver.quit_called for driver in fleet.started)
+
+
+def test_pool_yields_pages_as_they_complete():
+    release = Event()
+
+    def slow_page():
+        release.wait(5)
+        return 'slow'
+    fleet = Fleet({'slow': slow_page, 'fast': 'fast'})
+    with BrowserPool(size=2, max_pages=50, driver_factory=fleet.factory) as pool:
+        results = pool.fetch_all({'slow': 'slow', 'fast': 'fast'})
+        # the fast page arrives while the slow one is still loading
+        assert next(results) == ('fast', 'fast')
+        release.set()
+        assert next(results) == ('slow', 'slow')
+        assert set(pool.timings) == {'slow', 'fast'}
+
+
+def test_pool_skips_failed_pages():
+    fleet = Fleet({'ok': 'OK', 'broken': WebDriverException('tab crashed')})
+    with BrowserPool(size=2, max_pages=50, driver_factory=fleet.factory) as pool:
+        assert list(pool.fetch_all({'ok': 'ok', 'broken': 'broken'})) == [('ok', 'OK')]
+
+
+def test_element_stable_waits_for_unchanged_markup():
+    class Element:
+        def __init__(self, html):
+            self.html = html
+
+        def get_attribute(self, name):
+            return self.html
+
+    class Driver:
+        title = 'Drama'
+        elements = []
+
+        def find_elements(self, by, tag_name):
+            return self.elements
+
+    driver = Driver()
+    condition = ElementStable('app-media-list')
+    assert not condition(driver)
+    driver.elements = [Element('<a>1</a>')]
+    assert not condition(driver)
+    assert condition(driver)
+    driver.elements = [Element('<a>1</a><a>2</a>')]
+    assert not condition(driver)
+    driver.title = '404 Not Found'
+    with pytest.raises(ErrorPageError):
+        condition(driver)
+
+
+def test_is_retriable():
+    assert is_retriable(WebDriverException('crashed'))
+    assert not is_retriable(TimeoutException('never rendered'))
+    assert not is_retriable(ErrorPageError('404'))
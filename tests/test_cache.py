@@ -0,0 +1,52 @@
+from threading import Thread
+import time
+from scraper.cache import CacheStats, LRUCache
+
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    # reading a makes b the oldest
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+
+
+def test_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    cache = LRUCache(maxsize=10, ttl=30)
+    cache.set('a', 1)
+    now[0] += 29
+    assert cache.get('a') == 1
+    now[0] += 2
+    assert cache.get('a') is None
+    # setting again starts a new ttl
+    cache.set('a', 2)
+    now[0] += 29
+    assert cache.get('a') == 2
+
+
+def test_delete():
+    cache = LRUCache()
+    cache.set('a', 1)
+    cache.delete('a')
+    cache.delete('missing')
+    assert cache.get('a') is None
+
+
+def test_stats_count_across_threads():
+    stats = CacheStats()
+
+    def count():
+        for _ in range(1000):
+            stats.incr('hits')
+    threads = [Thread(target=count) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats.incr('misses')
+    assert stats.as_dict() == {'hits': 8000, 'misses': 1}
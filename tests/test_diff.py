@@ -0,0 +1,33 @@
+from scraper.diff import EpisodeDiff, diff_show_lists
+from scraper.parser import Episode
+
+
+def test_no_changes():
+    show_list = [('p1', 'E1'), ('p2', 'E2')]
+    assert diff_show_lists(show_list, list(show_list)) == EpisodeDiff([], [], [])
+
+
+def test_added_removed_and_renamed():
+    old_show_list = [('p1', 'E1'), ('p2', 'E2'), ('p3', 'E3')]
+    current_show_list = [Episode('p1', 'E1', 1), Episode('p3', 'E3 final', 2), Episode('p4', 'E4', 3)]
+    diff = diff_show_lists(current_show_list, old_show_list)
+    # added keeps the scraped episodes as given
+    assert diff.added == [Episode('p4', 'E4', 3)]
+    assert diff.removed == [('p2', 'E2')]
+    assert diff.renamed == [('p3', 'E3', 'E3 final')]
+
+
+def test_reordered_episodes_are_not_changes():
+    assert diff_show_lists([('p2', 'E2'), ('p1', 'E1')], [('p1', 'E1'), ('p2', 'E2')]) == EpisodeDiff([], [], [])
+
+
+def test_first_scrape():
+    diff = diff_show_lists([('p1', 'E1'), ('p2', 'E2')], [])
+    assert diff.added == [('p1', 'E1'), ('p2', 'E2')]
+    assert diff.removed == [] and diff.renamed == []
+
+
+def test_order_of_added_follows_current_list():
+    current_show_list = [('p{}'.format(i), 'E{}'.format(i)) for i in range(1000, 0, -1)]
+    diff = diff_show_lists(current_show_list, [('p500', 'E500')])
+    assert diff.added == [episode for episode in current_show_list if episode[0] != 'p500']
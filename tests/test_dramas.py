@@ -0,0 +1,107 @@
+import time
+import json
+from core.dramas import DramaLibrary
+
+
+def test_follow_and_abandon(redis_client):
+    library = DramaLibrary()
+    library.chase('a@x.com', 'd1', None)
+    library.chase('b@x.com', 'd1', None)
+    # following twice doesn't count twice
+    library.chase('b@x.com', 'd1', None)
+    library.chase('b@x.com', 'd2', None)
+    assert sorted(library.get_followed_drama_ids()) == ['d1', 'd2']
+    assert library.get_drama_ranking() == [('d2', 1), ('d1', 2)]
+    assert library.get_followers_of_dramas(['d1', 'd2']) == {'a@x.com': {'d1'}, 'b@x.com': {'d1', 'd2'}}
+    library.abandon('b@x.com', 'https://www.ifvod.tv/detail?id=d2">')
+    assert library.get_followed_drama_ids() == ['d1']
+    assert library.get_user_drama_ids('b@x.com') == ['d1']
+
+
+def test_rebuild_follower_index(redis_client):
+    library = DramaLibrary()
+    library.chase('a@x.com', 'd1', None)
+    library.chase('b@x.com', 'd1', None)
+    redis_client.delete('follower_counts', 'd1:followers')
+    assert library.rebuild_follower_index() == 1
+    assert library.get_drama_ranking() == [('d1', 2)]
+
+
+def test_drama_metadata(redis_client):
+    library = DramaLibrary()
+    library.chase('a@x.com', 'd1', None)
+    redis_client.hset('d1', mapping={
+        'drama_name': 'Drama One',
+        'current_show_list': json.dumps([['p1', 'E1'], ['p2', 'E2']])
+    })
+    assert library.get_drama_metadata('a@x.com') == {
+        'https://www.ifvod.tv/detail?id=d1': {
+            'drama_name': 'Drama One',
+            'show_list': [('https://www.ifvod.tv/play?id=p1', 'E1'), ('https://www.ifvod.tv/play?id=p2', 'E2')]
+        }
+    }
+
+
+def test_name_loader_skips_queued_dramas():
+    from threading import Event, Lock
+    from core.dramas import NameLoader
+    loader = NameLoader(2)
+    release = Event()
+    lock = Lock()
+    loaded = []
+    running = [0, 0]
+
+    def load(drama_id):
+        with lock:
+            running[0] += 1
+            running[1] = max(running)
+        release.wait(5)
+        with lock:
+            running[0] -= 1
+            loaded.append(drama_id)
+    for _ in range(3):
+        for i in range(10):
+            loader.submit('d{}'.format(i), load)
+    release.set()
+    deadline = time.time() + 5
+    while len(loaded) < 10 and time.time() < deadline:
+        time.sleep(0.01)
+    # every drama once, never more than 2 at a time
+    assert sorted(loaded) == sorted('d{}'.format(i) for i in range(10))
+    assert running[1] == 2
+    # a drama is queued again once its load finished
+    loader.submit('d0', load)
+    deadline = time.time() + 5
+    while len(loaded) < 11 and time.time() < deadline:
+        time.sleep(0.01)
+    assert loaded.count('d0') == 2
+
+
+def test_name_loader_survives_failed_load():
+    from threading import Event
+    from core.dramas import NameLoader
+    loader = NameLoader(1)
+    done = Event()
+
+    def fail(drama_id):
+        raise ValueError(drama_id)
+    loader.submit('d1', fail)
+    loader.submit('d2', lambda drama_id: done.set())
+    assert done.wait(5)
+
+
+def test_abandon_by_last_follower_unschedules(redis_client):
+    library = DramaLibrary()
+    library.chase('a@x.com', 'd1', None)
+    library.chase('b@x.com', 'd1', None)
+    redis_client.set('d1:cadence', '{"release_times": [], "misses": 1}')
+    library.abandon('a@x.com', 'https://www.ifvod.tv/detail?id=d1">')
+    assert redis_client.zscore('schedule', 'd1') is not None
+    assert redis_client.exists('d1:cadence')
+    # abandoning a drama one doesn't follow keeps it scheduled
+    library.abandon('a@x.com', 'https://www.ifvod.tv/detail?id=d1">')
+    assert redis_client.zscore('schedule', 'd1') is not None
+    library.abandon('b@x.com', 'https://www.ifvod.tv/detail?id=d1">')
+    assert redis_client.zscore('schedule', 'd1') is None
+    assert not redis_client.exists('d1:cadence')
+    assert library.get_drama_ranking() == []
@@ -0,0 +1,97 @@
+import smtplib
+from threading import Event
+import pytest
+from core import app
+from core import email
+from core.email import RateLimiter, build_email, send_bulk_email, send_email_batch
+
+
+# SMTP connection whose sends fail as told by the recipient address
+class FakeConnection:
+    def __init__(self, server):
+        self.__server = server
+
+    def __enter__(self):
+        self.__server.connects += 1
+        if self.__server.down:
+            raise smtplib.SMTPConnectError(421, 'down')
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def send(self, message):
+        recipient = message.recipients[0]
+        if recipient.startswith('refused'):
+            raise smtplib.SMTPRecipientsRefused({recipient: (550, 'no such user')})
+        if recipient.startswith('drop') and recipient not in self.__server.dropped:
+            self.__server.dropped.add(recipient)
+            raise smtplib.SMTPServerDisconnected('dropped')
+        self.__server.sent.append(recipient)
+
+
+class FakeServer:
+    def __init__(self, down=False):
+        self.down = down
+        self.connects = 0
+        self.sent = []
+        self.dropped = set()
+
+    def connect(self):
+        return FakeConnection(self)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = FakeServer()
+    monkeypatch.setattr(email.mail, 'connect', server.connect)
+    # no real waiting between reconnects
+    monkeypatch.setattr(Event, 'wait', lambda self, timeout=None: self.is_set())
+    return server
+
+
+def make_messages(*recipients):
+    return [build_email('subject', 'sender@dramachaser.local', [recipient], 'text', '<p>html</p>')
+            for recipient in recipients]
+
+
+def test_sends_over_one_connection(server):
+    messages = make_messages('a@x.com', 'b@x.com', 'c@x.com')
+    assert send_email_batch(app, messages, 2, RateLimiter(0)) == (3, [])
+    assert server.sent == ['a@x.com', 'b@x.com', 'c@x.com']
+    assert server.connects == 1
+
+
+def test_reconnects_after_dropped_connection(server):
+    messages = make_messages('a@x.com', 'drop@x.com', 'c@x.com')
+    assert send_email_batch(app, messages, 2, RateLimiter(0)) == (3, [])
+    assert server.sent == ['a@x.com', 'drop@x.com', 'c@x.com']
+    assert server.connects == 2
+
+
+def test_refused_recipient_fails_alone(server):
+    messages = make_messages('a@x.com', 'refused@x.com', 'c@x.com')
+    sent, failed = send_email_batch(app, messages, 2, RateLimiter(0))
+    assert sent == 2
+    assert failed == [messages[1]]
+    assert server.connects == 1
+
+
+def test_server_down_fails_batch_fast(server):
+    server.down = True
+    messages = make_messages(*['user{}@x.com'.format(i) for i in range(500)])
+    sent, failed = send_email_batch(app, messages, 2, RateLimiter(0))
+    assert sent == 0
+    assert failed == messages
+    # the first message used up the retries, the others are not tried at all
+    assert server.connects == 3
+
+
+def test_server_down_stops_other_workers(server, monkeypatch):
+    server.down = True
+    monkeypatch.setitem(app.config, 'MAIL_SENDER_WORKERS', 4)
+    messages = make_messages(*['user{}@x.com'.format(i) for i in range(100)])
+    summary = send_bulk_email(messages)
+    assert summary['sent'] == 0
+    assert len(summary['failed']) == 100
+    assert server.connects <= 4 * (app.config['MAIL_SEND_RETRIES'] + 1)
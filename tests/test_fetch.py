@@ -0,0 +1,21 @@
+from scraper import fetch
+
+
+def get_pool_maxsize():
+    return fetch.session.get_adapter('https://www.ifvod.tv')._pool_maxsize
+
+
+def test_reserve_pool_grows_to_concurrent_reservations():
+    base = fetch.pool_size
+    with fetch.reserve_pool(base):
+        assert get_pool_maxsize() == base
+        old_session = fetch.session
+        with fetch.reserve_pool(6):
+            assert fetch.pool_size == base + 6
+            assert get_pool_maxsize() == base + 6
+            assert fetch.session is not old_session
+        assert fetch.reserved == base
+    assert fetch.reserved == 0
+    # the bigger pool is kept for the next run
+    with fetch.reserve_pool(base):
+        assert get_pool_maxsize() == base + 6
@@ -0,0 +1,14 @@
+from benchmarks.import_budget import FORBIDDEN_MODULES, measure
+
+BUDGET_SECONDS = 1.5
+
+
+def test_web_app_starts_without_scraping_engine():
+    _, _, modules = measure()
+    assert [module for module in FORBIDDEN_MODULES if module in modules] == []
+
+
+def test_web_app_import_time():
+    # the fastest of a few starts, the first one may read cold files
+    seconds = min(measure()[0] for _ in range(3))
+    assert seconds < BUDGET_SECONDS
@@ -0,0 +1,49 @@
+import time
+from scraper.lease import LeaseManager
+
+
+def test_leases_are_exclusive(redis_client):
+    first = LeaseManager(redis_client, ttl=60)
+    second = LeaseManager(redis_client, ttl=60)
+    assert first.acquire_all(['d1', 'd2']) == ['d1', 'd2']
+    assert second.acquire_all(['d1', 'd2', 'd3']) == ['d3']
+    first.release_all(['d1'])
+    assert second.acquire_all(['d1', 'd2']) == ['d1']
+
+
+def test_only_the_owner_releases(redis_client):
+    owner = LeaseManager(redis_client, ttl=60)
+    other = LeaseManager(redis_client, ttl=60)
+    owner.acquire_all(['d1'])
+    other.release_all(['d1'])
+    assert redis_client.exists('lease:d1')
+    owner.release_all(['d1'])
+    assert not redis_client.exists('lease:d1')
+
+
+def test_held_leases_are_renewed(redis_client):
+    with LeaseManager(redis_client, ttl=0.3) as leases:
+        leases.acquire_all(['d1'])
+        time.sleep(0.6)
+        assert redis_client.exists('lease:d1')
+        assert LeaseManager(redis_client, ttl=0.3).acquire_all(['d1']) == []
+    # released on exit
+    assert not redis_client.exists('lease:d1')
+
+
+def test_leases_of_a_dead_worker_expire(redis_client):
+    # never entered, so nothing renews its leases
+    dead_worker = LeaseManager(redis_client, ttl=0.2)
+    dead_worker.acquire_all(['d1'])
+    time.sleep(0.3)
+    assert LeaseManager(redis_client, ttl=60).acquire_all(['d1']) == ['d1']
+
+
+def test_lost_lease_is_not_renewed(redis_client):
+    with LeaseManager(redis_client, ttl=0.3) as leases:
+        leases.acquire_all(['d1'])
+        redis_client.set('lease:d1', 'someone else')
+        time.sleep(0.3)
+        assert redis_client.get('lease:d1') == b'someone else'
+    # releasing on exit leaves the new owner alone
+    assert redis_client.get('lease:d1') == b'someone else'
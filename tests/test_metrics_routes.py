@@ -0,0 +1,57 @@
+import pytest
+from core import app
+from core.models import User, user_cache
+from metrics import LAST_RUN_KEY, metrics
+
+
+@pytest.fixture
+def client(redis_client, db, monkeypatch):
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', 'secret')
+    monkeypatch.setitem(app.config, 'WTF_CSRF_ENABLED', False)
+    return app.test_client()
+
+
+def log_in(client, db, email):
+    user = User(username=email.split('@')[0], email=email)
+    user.set_password('password')
+    db.session.add(user)
+    db.session.commit()
+    # ids are reused across tests, drop the cached user of an earlier one
+    user_cache.invalidate(user.id)
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+        session['_fresh'] = True
+
+
+def test_metrics_need_token_or_admin(client, db):
+    assert client.get('/metrics').status_code == 403
+    assert client.get('/metrics/last_run').status_code == 403
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 403
+    log_in(client, db, 'someone@x.com')
+    assert client.get('/metrics').status_code == 403
+
+
+def test_metrics_with_token(client, redis_client):
+    redis_client.set(LAST_RUN_KEY, '{"dramas": 3}')
+    headers = {'Authorization': 'Bearer secret'}
+    assert client.get('/metrics', headers=headers).status_code == 200
+    assert client.get('/metrics/last_run', headers=headers).get_json() == {'dramas': 3}
+
+
+def test_metrics_for_admin(client, db):
+    log_in(client, db, app.config['ADMINS'][0])
+    assert client.get('/metrics').status_code == 200
+
+
+def test_metrics_are_not_flushed_by_scrape(client, redis_client):
+    metrics.incr('scrape_test_total')
+    body = client.get('/metrics', headers={'Authorization': 'Bearer secret'}).get_data(as_text=True)
+    assert 'scrape_test_total' not in body
+    metrics.flush(redis_client)
+    body = client.get('/metrics', headers={'Authorization': 'Bearer secret'}).get_data(as_text=True)
+    assert 'dramachaser_scrape_test_total 1.0' in body
+
+
+def test_no_token_configured(client, monkeypatch):
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', None)
+    assert client.get('/metrics', headers={'Authorization': 'Bearer None'}).status_code == 403
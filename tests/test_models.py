@@ -0,0 +1,50 @@
+from core.models import User, UserCache
+
+
+def add_user(db, username, about_me=None):
+    user = User(username=username, email='{}@x.com'.format(username), about_me=about_me)
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+
+def test_user_is_read_from_db_once(redis_client, db, monkeypatch):
+    user_id = add_user(db, 'alice', about_me='hi')
+    cache = UserCache(redis_client, maxsize=10, local_ttl=30, ttl=60)
+    user = cache.get(user_id)
+    assert (user.id, user.username, user.email, user.about_me) == (user_id, 'alice', 'alice@x.com', 'hi')
+    assert 0 < redis_client.ttl('user:{}'.format(user_id)) <= 60
+    # other processes find it in redis, this one in its local cache, any
+    # query of the user table fails from now on
+    monkeypatch.setattr(User, 'query', None)
+    assert cache.get(user_id) is user
+    other_process = UserCache(redis_client, maxsize=10, local_ttl=30, ttl=60)
+    user = other_process.get(user_id)
+    assert (user.id, user.username, user.about_me) == (user_id, 'alice', 'hi')
+
+
+def test_missing_fields_read_back_as_none(redis_client, db):
+    user_id = add_user(db, 'bob')
+    cache = UserCache(redis_client, maxsize=10, local_ttl=30, ttl=60)
+    cache.get(user_id)
+    user = UserCache(redis_client, maxsize=10, local_ttl=30, ttl=60).get(user_id)
+    assert user.username == 'bob' and user.about_me is None
+
+
+def test_unknown_user(redis_client, db):
+    cache = UserCache(redis_client, maxsize=10, local_ttl=30, ttl=60)
+    assert cache.get(12345) is None
+    assert not redis_client.exists('user:12345')
+
+
+def test_invalidate(redis_client, db):
+    user_id = add_user(db, 'carol')
+    cache = UserCache(redis_client, maxsize=10, local_ttl=30, ttl=60)
+    cache.get(user_id)
+    user = User.query.get(user_id)
+    user.about_me = 'changed'
+    db.session.commit()
+    assert cache.get(user_id).about_me is None
+    cache.invalidate(user_id)
+    assert not redis_client.exists('user:{}'.format(user_id))
+    assert cache.get(user_id).about_me == 'changed'
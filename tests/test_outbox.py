@@ -0,0 +1,67 @@
+import pytest
+from core import outbox
+from core.outbox import Outbox
+
+
+# stands in for send_bulk_email, fails the emails to failing recipients
+class FakeMailer:
+    def __init__(self):
+        self.sent = []
+        self.failing = set()
+
+    def send_bulk_email(self, messages):
+        failed = [msg for msg in messages if set(msg.recipients) & self.failing]
+        self.sent += [msg for msg in messages if all(msg is not other for other in failed)]
+        return {'sent': len(messages) - len(failed), 'failed': failed}
+
+
+@pytest.fixture
+def mailer(monkeypatch):
+    mailer = FakeMailer()
+    monkeypatch.setattr(outbox, 'send_bulk_email', mailer.send_bulk_email)
+    return mailer
+
+
+def enqueue(box, recipient):
+    box.enqueue('New episodes', 'no-reply@x.com', [recipient], 'text', '<p>html</p>')
+
+
+def test_deliver_sends_and_acknowledges(redis_client, mailer):
+    box = Outbox(redis_client)
+    enqueue(box, 'a@x.com')
+    enqueue(box, 'b@x.com')
+    assert box.deliver('worker1') == 2
+    assert sorted(msg.recipients[0] for msg in mailer.sent) == ['a@x.com', 'b@x.com']
+    assert mailer.sent[0].subject == 'New episodes' and mailer.sent[0].html == '<p>html</p>'
+    assert redis_client.xlen('outbox') == 0
+    assert box.deliver('worker1') == 0
+
+
+def test_enqueue_in_a_transaction(redis_client, mailer):
+    box = Outbox(redis_client)
+    pipe = redis_client.pipeline()
+    enqueue(box, 'a@x.com')
+    enqueue(box, 'b@x.com')
+    box.enqueue('Hi', 'no-reply@x.com', ['c@x.com'], 'text', 'html', pipe=pipe)
+    assert redis_client.xlen('outbox') == 2
+    pipe.execute()
+    assert redis_client.xlen('outbox') == 3
+
+
+def test_failed_emails_are_retried_then_dead_lettered(redis_client, mailer):
+    box = Outbox(redis_client, max_deliveries=2, retry_after=0)
+    mailer.failing.add('bad@x.com')
+    enqueue(box, 'bad@x.com')
+    enqueue(box, 'good@x.com')
+    assert box.deliver('worker1') == 2
+    assert [msg.recipients for msg in mailer.sent] == [['good@x.com']]
+    # another worker takes over the pending email
+    assert box.deliver('worker2') == 1
+    assert redis_client.xlen('outbox:dead') == 0
+    # delivered max_deliveries times, given up on
+    assert box.deliver('worker2') == 0
+    assert redis_client.xlen('outbox:dead') == 1
+    assert redis_client.xlen('outbox') == 0
+    mailer.failing.clear()
+    assert box.deliver('worker1') == 0
+    assert len(mailer.sent) == 1
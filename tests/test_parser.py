@@ -0,0 +1,132 @@
+import os
+import re
+import pytest
+from scraper.parser import (
+    Episode, ParseError, find_media_list, parse_fragment, parse_media_list, parse_plain_links, parse_tag, scan_links)
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return f.read()
+
+
+def wrap(fragment):
+    return '<html><body><app-media-list _nghost-c1="">{}</app-media-list><p>footer</p></body></html>'.format(fragment)
+
+
+# yields the page in chunks and remembers how much of it was read
+class ChunkReader:
+    def __init__(self, page, size):
+        self.page = page
+        self.size = size
+        self.read = 0
+
+    def __iter__(self):
+        while self.read < len(self.page):
+            chunk = self.page[self.read:self.read + self.size]
+            self.read += len(chunk)
+            yield chunk
+
+
+def test_plain_page():
+    episodes = parse_media_list(read_fixture('ifvod_detail_plain.html'))
+    assert len(episodes) == 1200
+    assert episodes[0] == Episode('kl0001', '第1期', 1)
+    assert episodes[-1] == Episode('kl1200', '第1200期', 1200)
+
+
+def test_plain_page_matches_old_regex():
+    page = read_fixture('ifvod_detail_plain.html')
+    fragment = re.search('<app-media-list.*?>(.*?)</app-media-list>', page, re.DOTALL).group(1)
+    expected = re.findall(r'\"/play\?id=(.*?)\">(.*?)</a>', fragment)
+    assert [episode[:2] for episode in parse_media_list(page)] == expected
+
+
+def test_fast_path_matches_scan():
+    fragment = find_media_list(read_fixture('ifvod_detail_plain.html'))
+    assert parse_plain_links(fragment) == scan_links(fragment)
+
+
+def test_angular_page():
+    fragment = find_media_list(read_fixture('ifvod_detail_angular.html'))
+    # attributes around href need the full scan
+    assert parse_plain_links(fragment) is None
+    episodes = parse_fragment(fragment)
+    assert [episode.play_id for episode in episodes] == ['ll{:03d}'.format(i) for i in range(1, 41)]
+    assert episodes[6] == Episode('ll007', '第07集 & 预告', 7)
+    assert episodes[9] == Episode('ll010', '第10集', 10)
+
+
+def test_page_without_list():
+    with pytest.raises(ParseError, match='No <app-media-list>'):
+        find_media_list(read_fixture('ifvod_detail_not_found.html'))
+
+
+def test_unclosed_list():
+    page = '<app-media-list><a href="/play?id=1">E1</a>'
+    with pytest.raises(ParseError, match='not closed'):
+        find_media_list(page)
+    with pytest.raises(ParseError, match='not closed'):
+        find_media_list(ChunkReader(page, 4))
+
+
+def test_unclosed_link():
+    with pytest.raises(ParseError, match='Unclosed episode link'):
+        parse_fragment('<a class="c" href="/play?id=1">E1')
+    with pytest.raises(ParseError, match='Unclosed episode link'):
+        parse_fragment('<a class="c" href="/play?id=1>E1</a>')
+
+
+def test_empty_list():
+    assert parse_media_list(wrap('<ul></ul>')) == []
+
+
+@pytest.mark.parametrize('link', [
+    '<a\nhref="/play?id=a3">E3</a>',
+    '<a\thref="/play?id=a3">E3</a>',
+    '<a\r\n   href = "/play?id=a3"\n>\n  E3\n</a>',
+    '<a class="episode"\n   href="/play?id=a3">E3</a>',
+    '<a href="/play?id=a3" >E3</a>',
+    "<a href='/play?id=a3'>E3</a>",
+    '<a href=/play?id=a3>E3</a>',
+    '<a HREF="/play?id=a3">E3</a>',
+    '<a href="/play?id=a3"><span>E3</span></a>',
+])
+def test_link_markup(link):
+    fragment = '<a href="/play?id=a1">E1</a><a href="/play?id=a2">E2</a>' + link
+    assert parse_fragment(fragment) == [Episode('a1', 'E1', 1), Episode('a2', 'E2', 2), Episode('a3', 'E3', 3)]
+
+
+def test_quoted_greater_than():
+    assert parse_fragment('<a href="/play?id=1" title="x>y">T</a>') == [Episode('1', 'T', 1)]
+    assert parse_tag('<a title="x>y" href="/play?id=1">', 0) == ({'title': 'x>y', 'href': '/play?id=1'}, 33)
+
+
+def test_entities():
+    assert parse_fragment(
+        '<a href="/play?id=1&amp;lang=zh">Tom &amp; Jerry</a><a href="/play?id=2">&#31532;2&#38598;</a>'
+    ) == [Episode('1', 'Tom & Jerry', 1), Episode('2', '第2集', 2)]
+
+
+def test_other_links_skipped():
+    fragment = '<abbr>x</abbr><a href="/detail?id=other">Other</a><a>none</a><a href="/play?id=1">E1</a>'
+    assert parse_fragment(fragment) == [Episode('1', 'E1', 1)]
+
+
+def test_chunk_boundaries():
+    page = wrap('<a href="/play?id=1">E1</a>\n<a class="c" href="/play?id=2">E2</a>')
+    expected = find_media_list(page)
+    for split in range(len(page) + 1):
+        assert find_media_list([page[:split], page[split:]]) == expected
+    for size in range(1, 40):
+        assert find_media_list(ChunkReader(page, size)) == expected
+
+
+def test_stops_reading_after_list():
+    page = read_fixture('ifvod_detail_angular.html')
+    reader = ChunkReader(page, 256)
+    assert find_media_list(reader) == find_media_list(page)
+    assert reader.read < len(page)
+    assert reader.read - page.index('</app-media-list>') <= 256
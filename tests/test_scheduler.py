@@ -0,0 +1,60 @@
+import json
+from scraper.scheduler import MAX_RELEASE_HISTORY, PollScheduler
+
+DAY = 86400
+
+
+def new_scheduler(redis_client):
+    return PollScheduler(redis_client, min_interval=900, default_interval=3600, max_interval=7 * DAY)
+
+
+def test_new_dramas_are_due(redis_client):
+    scheduler = new_scheduler(redis_client)
+    scheduler.add('d1')
+    assert scheduler.get_due(['d1', 'unscheduled']) == ['d1', 'unscheduled']
+    # adding again keeps the due time
+    scheduler.reschedule(['d1'], set(), now=1000)
+    scheduler.add('d1')
+    assert scheduler.get_due(['d1'], now=1000) == []
+
+
+def test_intervals_without_history_back_off():
+    scheduler = PollScheduler(None, min_interval=900, default_interval=3600, max_interval=7 * DAY)
+    intervals = [scheduler.get_next_interval({'release_times': [], 'misses': misses}, 0) for misses in range(10)]
+    assert intervals[:3] == [3600, 7200, 14400]
+    assert intervals[-1] == 7 * DAY
+
+
+def test_weekly_drama_sleeps_until_next_release():
+    scheduler = PollScheduler(None, min_interval=900, default_interval=3600, max_interval=7 * DAY)
+    cadence = {'release_times': [0, 7 * DAY, 14 * DAY], 'misses': 0}
+    assert scheduler.get_next_interval(cadence, 14 * DAY + 3600) == 7 * DAY - 3600
+    # overdue, poll often at first then back off
+    assert scheduler.get_next_interval(dict(cadence, misses=1), 21 * DAY + 60) == 900
+    assert scheduler.get_next_interval(dict(cadence, misses=3), 21 * DAY + 60) == 3600
+    assert scheduler.get_next_interval(dict(cadence, misses=30), 21 * DAY + 60) == 7 * DAY
+
+
+def test_reschedule_learns_cadence(redis_client):
+    scheduler = new_scheduler(redis_client)
+    now = 1000000
+    for week in range(MAX_RELEASE_HISTORY + 2):
+        scheduler.reschedule(['d1'], {'d1'}, now=now + week * 7 * DAY)
+    cadence = json.loads(redis_client.get('d1:cadence'))
+    assert len(cadence['release_times']) == MAX_RELEASE_HISTORY
+    assert cadence['misses'] == 0
+    last_release = now + (MAX_RELEASE_HISTORY + 1) * 7 * DAY
+    assert redis_client.zscore('schedule', 'd1') == last_release + 7 * DAY
+    scheduler.reschedule(['d1'], set(), now=last_release + 7 * DAY)
+    assert json.loads(redis_client.get('d1:cadence'))['misses'] == 1
+    assert scheduler.get_due(['d1'], now=last_release + 7 * DAY) == []
+    assert scheduler.get_due(['d1'], now=last_release + 7 * DAY + 900) == ['d1']
+
+
+def test_remove(redis_client):
+    scheduler = new_scheduler(redis_client)
+    scheduler.reschedule(['d1', 'd2'], {'d1'}, now=1000)
+    scheduler.remove('d1')
+    assert redis_client.zrange('schedule', 0, -1) == [b'd2']
+    assert not redis_client.exists('d1:cadence')
+    assert redis_client.exists('d2:cadence')
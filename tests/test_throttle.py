@@ -0,0 +1,113 @@
+from threading import Lock, Thread
+import time
+import pytest
+from scraper import throttle as throttle_module
+from scraper.throttle import CircuitBreaker, CircuitOpenError, Throttle, TokenBucket
+
+
+class Unavailable(Exception):
+    pass
+
+
+class NotFound(Exception):
+    pass
+
+
+def fail(ex):
+    raise ex
+
+
+def test_bucket_limits_rate(redis_client):
+    bucket = TokenBucket(redis_client, 'throttle:rate.test:bucket', rate=20, burst=2)
+    start = time.time()
+    for _ in range(4):
+        bucket.acquire()
+    # the burst goes at once, two more tokens take 50ms each
+    assert 0.08 <= time.time() - start < 1
+
+
+def test_bucket_uses_server_time(redis_client, monkeypatch):
+    # a client clock far off doesn't change the bucket
+    monkeypatch.setattr(throttle_module.time, 'time', lambda: 0)
+    bucket = TokenBucket(redis_client, 'throttle:skew.test:bucket', rate=1, burst=1)
+    bucket.acquire()
+    seconds, microseconds = redis_client.time()
+    stored = int(redis_client.hget('throttle:skew.test:bucket', 'time'))
+    assert abs(stored - (seconds * 1000 + microseconds // 1000)) < 1000
+
+
+def test_circuit_half_open(redis_client):
+    circuit = CircuitBreaker(redis_client, 'throttle:circuit.test', failure_threshold=2, reset_timeout=1)
+    assert circuit.check() is False
+    circuit.record_failure()
+    assert circuit.check() is False
+    circuit.record_failure()
+    with pytest.raises(CircuitOpenError):
+        circuit.check()
+    time.sleep(1.1)
+    # a single probe goes through once the circuit was open for reset_timeout
+    assert circuit.check() is True
+    with pytest.raises(CircuitOpenError):
+        circuit.check()
+    # its failure opens the circuit again
+    circuit.record_failure()
+    with pytest.raises(CircuitOpenError):
+        circuit.check()
+    time.sleep(1.1)
+    assert circuit.check() is True
+    # its success closes it
+    circuit.record_success()
+    assert circuit.check() is False
+    assert circuit.check() is False
+
+
+def test_non_retriable_probe_lets_next_probe_through(redis_client):
+    throttle = Throttle(redis_client, 'probe.test', rate=1000, burst=1000, retries=0,
+                        failure_threshold=1, reset_timeout=1)
+    with pytest.raises(Unavailable):
+        throttle.call(fail, Unavailable())
+    with pytest.raises(CircuitOpenError):
+        throttle.call(lambda: 'page')
+    time.sleep(1.1)
+    with pytest.raises(NotFound):
+        throttle.call(fail, NotFound(), retriable=lambda ex: isinstance(ex, Unavailable))
+    assert throttle.call(lambda: 'page') == 'page'
+
+
+def test_retries_then_gives_up(redis_client):
+    throttle = Throttle(redis_client, 'retry.test', rate=1000, burst=1000, retries=2, backoff=0.01,
+                        failure_threshold=10)
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise Unavailable()
+        return 'page'
+
+    assert throttle.call(flaky) == 'page'
+    assert len(calls) == 3
+    with pytest.raises(Unavailable):
+        throttle.call(fail, Unavailable())
+
+
+def test_concurrency_is_shared_by_throttles_of_a_domain(redis_client):
+    lock = Lock()
+    running = [0, 0]
+
+    def fetch():
+        with lock:
+            running[0] += 1
+            running[1] = max(running[1], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+
+    # like one throttle per web request or chaser
+    throttles = [Throttle(redis_client, 'concurrency.test', rate=1000, burst=1000, concurrency=2) for _ in range(6)]
+    threads = [Thread(target=throttle.call, args=(fetch,)) for throttle in throttles]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert running[1] == 2